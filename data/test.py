@@ -1,30 +1,53 @@
 import os
-import struct
+import time
+import argparse
 import numpy as np
 import cv2
 from tqdm import tqdm
 import json
-import tensorflow as tf
-from sklearn.model_selection import train_test_split
+import sys
+from collections import defaultdict
+from contextlib import ExitStack
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from dataset_io import (DEFAULT_NUM_SHARDS, MANIFEST_NAME, VAL_FRACTION, PackedSampleStore,
+                        ShardedTFRecordWriter, encode_example, stratified_split)
+from instrumentation import StageTrace
 
 # Path to ETL9G dataset and output path
 ETL9G_PATH = './etl9g'
 OUTPUT_PATH = './processed_data'
+SAMPLE_STORE_PATH = os.path.join(OUTPUT_PATH, 'etl9g_samples')
 
 # Create output directories
 os.makedirs(OUTPUT_PATH, exist_ok=True)
 os.makedirs(os.path.join(OUTPUT_PATH, 'images'), exist_ok=True)
 
+# ETL9G record layout: 8199-byte records holding a big-endian JIS X 0208 code
+# and a 128x127 image packed as 4 bits per pixel starting at byte 64
+ETL9G_RECORD_SIZE = 8199
+ETL9G_IMAGE_WIDTH = 128
+ETL9G_IMAGE_HEIGHT = 127
+ETL9G_RECORD_DTYPE = np.dtype({
+    'names': ['sheet', 'jis_code', 'image'],
+    'formats': ['>u2', '>u2', ('u1', ETL9G_IMAGE_WIDTH * ETL9G_IMAGE_HEIGHT // 2)],
+    'offsets': [0, 2, 64],
+    'itemsize': ETL9G_RECORD_SIZE,
+})
+IMAGE_SIZE = (64, 64)
+RESIZE_BATCH = 512  # cv2.resize handles at most 512 channels per call
+
 # Define target JIS X 0208 ranges for hiragana and katakana
 HIRAGANA_RANGE = [(0x2421, 0x2473)]  # Hiragana: starts at 0x2421
 KATAKANA_RANGE = [(0x2521, 0x2576)]   # Katakana: starts at 0x2521
 
-def is_target_char(jis_code):
-    """Check if the adjusted JIS code is within our target ranges."""
+def target_mask(jis_codes):
+    """Check which JIS codes in an array fall within our target ranges."""
+    mask = np.zeros(len(jis_codes), dtype=bool)
     for start, end in HIRAGANA_RANGE + KATAKANA_RANGE:
-        if start <= jis_code <= end:
-            return True
-    return False
+        mask |= (jis_codes >= start) & (jis_codes <= end)
+    return mask
 
 def jis_to_unicode(jis_code):
     """
@@ -43,11 +66,55 @@ character_map = {}
 reverse_character_map = {}
 current_index = 0
 
-def process_etl9g():
+def unpack_4bit(packed):
+    """Unpack (n, 8128) 4-bit packed records into (n, 127, 128) uint8 images."""
+    images = np.empty((len(packed), packed.shape[1] * 2), dtype=np.uint8)
+    images[:, 0::2] = packed >> 4
+    images[:, 1::2] = packed & 0x0F
+    # Stretch the 16 gray levels to the full 0-255 range
+    images *= 17
+    return images.reshape(-1, ETL9G_IMAGE_HEIGHT, ETL9G_IMAGE_WIDTH)
+
+def resize_batch(images):
+    """Resize a stack of images by treating them as channels of a single cv2.resize call."""
+    resized = np.empty((len(images), *IMAGE_SIZE), dtype=np.uint8)
+    for start in range(0, len(images), RESIZE_BATCH):
+        chunk = images[start:start + RESIZE_BATCH]
+        out = cv2.resize(np.ascontiguousarray(chunk.transpose(1, 2, 0)), IMAGE_SIZE)
+        # cv2 drops the channel axis for single-image chunks
+        resized[start:start + len(chunk)] = out.reshape(*IMAGE_SIZE, -1).transpose(2, 0, 1)
+    return resized
+
+def read_etl9g_file(file_path):
+    """Read one ETL9G file and return (jis_codes, images) for its hiragana/katakana records.
+    
+    The file is memory-mapped with a structured record dtype so only the
+    selected records are ever copied out; images come back resized,
+    inverted and as uint8.
+    """
+    record_count = os.path.getsize(file_path) // ETL9G_RECORD_SIZE
+    if record_count == 0:
+        return np.empty(0, dtype=np.int32), np.empty((0, *IMAGE_SIZE), dtype=np.uint8)
+    
+    records = np.memmap(file_path, dtype=ETL9G_RECORD_DTYPE, mode='r', shape=(record_count,))
+    jis_codes = records['jis_code'].astype(np.int32)
+    mask = target_mask(jis_codes)
+    
+    images = resize_batch(unpack_4bit(records['image'][mask]))
+    # Invert colors
+    images = 255 - images
+    return jis_codes[mask], images
+
+def process_etl9g(workers=None, dump_png=True, trace=None, num_shards=DEFAULT_NUM_SHARDS,
+                  val_fraction=VAL_FRACTION):
+    """Stream every hiragana/katakana record into sharded train/val TFRecords and the packed sample store.
+    
+    Each record is assigned to a split as it is read (see stratified_split),
+    so memory use does not grow with the dataset. Returns the number of
+    records written to each split.
+    """
     global current_index
-
-    dataset_images = []
-    dataset_labels = []
+    trace = trace or StageTrace('etl9g')
 
     # Files expected to contain hiragana/katakana (e.g. ETL9G_33 to ETL9G_50)
     expected_files = [f'ETL9G_{i:02d}' for i in range(33, 51)]
@@ -57,41 +124,29 @@ def process_etl9g():
     print(f"Available files: {available_files}")
 
     files = sorted(available_files)
-    total_records = 0
+    file_paths = [os.path.join(ETL9G_PATH, file_name) for file_name in files]
+    total_records = sum(os.path.getsize(path) // ETL9G_RECORD_SIZE for path in file_paths)
     matched_records = 0
-
-    for file_name in files:
-        file_path = os.path.join(ETL9G_PATH, file_name)
-        print(f"Processing {file_path}...")
-
-        with open(file_path, 'rb') as f:
-            record_count = 0
-            while True:
-                # Each record is 8199 bytes
-                record_data = f.read(8199)
-                if not record_data or len(record_data) < 8199:
-                    break
-
-                record_count += 1
-                total_records += 1
-
-                # The first 2 bytes store a raw code (big-endian unsigned short)
-                raw_jis_code = struct.unpack('>H', record_data[0:2])[0]
-                # Adjust the raw code by adding offset 0x2420 so that 0x0001 becomes 0x2421.
-                adjusted_jis_code = raw_jis_code + 0x2420
-
-                # Debug: print a few records
-                if record_count <= 5 or record_count % 1000 == 0:
-                    print(f"Record {record_count}: raw code: 0x{raw_jis_code:04x}, adjusted: 0x{adjusted_jis_code:04x}")
-
-                # Skip record if adjusted code isn't in the target range
-                if not is_target_char(adjusted_jis_code):
-                    continue
-
-                matched_records += 1
-
-                # Convert the adjusted code to a Unicode character
-                unicode_char = jis_to_unicode(adjusted_jis_code)
+    # Next PNG index per character, instead of listing the directory for every sample
+    sample_counts = defaultdict(int)
+
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        pool = stack.enter_context(Pool(processes=workers or os.cpu_count()))
+        store = stack.enter_context(PackedSampleStore(SAMPLE_STORE_PATH, IMAGE_SIZE))
+        writers = {split: stack.enter_context(ShardedTFRecordWriter(OUTPUT_PATH, split, num_shards))
+                   for split in ('train', 'val')}
+        # imap keeps files in sorted order so class indices are assigned deterministically
+        results = trace.timed_iter('read_decode', pool.imap(read_etl9g_file, file_paths))
+        for file_name, (jis_codes, images) in zip(files, results):
+            print(f"Processed {file_name}: {len(jis_codes)} hiragana/katakana records")
+            matched_records += len(jis_codes)
+            trace.count('files')
+            trace.count('matched_records', len(jis_codes))
+
+            for jis_code, img in zip(jis_codes, images):
+                # Convert the JIS code to a Unicode character
+                unicode_char = jis_to_unicode(int(jis_code))
                 if unicode_char is None:
                     continue
 
@@ -100,34 +155,48 @@ def process_etl9g():
                     character_map[current_index] = unicode_char
                     reverse_character_map[unicode_char] = current_index
                     current_index += 1
-                    print(f"Found new character: {unicode_char} (JIS: 0x{adjusted_jis_code:04x})")
+                    print(f"Found new character: {unicode_char} (JIS: 0x{jis_code:04x})")
 
-                # Extract image data (128x127 pixels, 1 byte per pixel)
-                img_data = record_data[2:2 + 128 * 127]
-                img = np.frombuffer(img_data, dtype=np.uint8).reshape(127, 128)
-
-                # Resize image to 64x64
-                img = cv2.resize(img, (64, 64))
-                # Invert colors and normalize to [0, 1]
-                img = 255 - img
-                img = img / 255.0
+                label = reverse_character_map[unicode_char]
+                with trace.stage('sample_store_write'):
+                    store.write(img, label)
 
                 # Save image to corresponding directory
-                character_dir = os.path.join(OUTPUT_PATH, 'images', unicode_char)
-                os.makedirs(character_dir, exist_ok=True)
-                img_filename = f"{character_dir}/{len(os.listdir(character_dir))}.png"
-                cv2.imwrite(img_filename, img * 255)
-
-                # Append image and label to dataset
-                dataset_images.append(img)
-                dataset_labels.append(reverse_character_map[unicode_char])
-
-            print(f"Processed {record_count} records from {file_name}")
-
-    print(f"Total records processed: {total_records}")
+                if dump_png:
+                    with trace.stage('png_write'):
+                        character_dir = os.path.join(OUTPUT_PATH, 'images', unicode_char)
+                        if sample_counts[unicode_char] == 0:
+                            os.makedirs(character_dir, exist_ok=True)
+                        cv2.imwrite(f"{character_dir}/{sample_counts[unicode_char]}.png", img)
+
+                # Split per character so every class keeps close to val_fraction of its samples
+                split = stratified_split(unicode_char, sample_counts[unicode_char], val_fraction)
+                with trace.stage('serialize'):
+                    record = encode_example(img, label)
+                with trace.stage('tfrecord_write'):
+                    writers[split].write(record)
+                trace.count(f'{split}_records')
+                sample_counts[unicode_char] += 1
+        split_counts = {split: writer.count for split, writer in writers.items()}
+    elapsed = time.perf_counter() - start
+
+    # Replace the manifest of any synthetic build in the same directory; its
+    # parameters (e.g. --clean) do not describe these shards
+    with open(os.path.join(OUTPUT_PATH, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump({
+            'source': 'etl9g',
+            'num_shards': num_shards,
+            'class_partitioned': False,  # records are written round-robin
+            'params': {'val_fraction': val_fraction},
+            'records': split_counts,
+        }, f, indent=2)
+
+    print(f"Total records processed: {total_records} in {elapsed:.1f}s "
+          f"({total_records / max(elapsed, 1e-9):.0f} records/sec)")
     print(f"Matched hiragana/katakana records: {matched_records}")
+    print(f"Packed sample store written to {SAMPLE_STORE_PATH}.bin")
 
-    return np.array(dataset_images), np.array(dataset_labels)
+    return split_counts
 
 def check_etl9g_directory():
     if not os.path.exists(ETL9G_PATH):
@@ -149,67 +218,52 @@ def save_character_map():
     with open(os.path.join(OUTPUT_PATH, 'reverse_character_map.json'), 'w', encoding='utf-8') as f:
         json.dump(reverse_character_map, f, ensure_ascii=False, indent=2)
 
-def main():
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert the ETL9G dataset into TFRecords.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes for reading ETL9G files (default: all CPUs)")
+    parser.add_argument('--no-png-dump', dest='dump_png', action='store_false',
+                        help="Skip writing one PNG per sample; the packed sample store is always written")
+    parser.add_argument('--shards', type=int, default=DEFAULT_NUM_SHARDS,
+                        help="Number of TFRecord shards per split")
+    parser.add_argument('--val-fraction', type=float, default=VAL_FRACTION,
+                        help="Fraction of every character's samples assigned to the validation split")
+    parser.add_argument('--trace', default=None,
+                        help="Write per-stage timings and counters to this .json or .csv file")
+    return parser.parse_args()
+
+def main(workers=None, dump_png=True, trace=None, num_shards=DEFAULT_NUM_SHARDS, val_fraction=VAL_FRACTION):
+    trace = trace or StageTrace('etl9g')
     print("Checking ETL9G dataset directory...")
     if not check_etl9g_directory():
         print("ERROR: Cannot proceed without valid ETL9G dataset.")
         return 0
 
     print("Processing ETL9G dataset...")
-    images, labels = process_etl9g()
+    split_counts = process_etl9g(workers, dump_png, trace, num_shards, val_fraction)
 
     num_characters = len(character_map)
-    print(f"Processed {len(images)} images across {num_characters} characters")
+    total = sum(split_counts.values())
+    print(f"Processed {total} images across {num_characters} characters")
 
-    if len(images) == 0:
-        print("ERROR: No images were processed. Cannot create TFRecord files.")
-        if num_characters > 0:
-            save_character_map()
+    if num_characters > 0:
+        save_character_map()
+    if total == 0:
+        print("ERROR: No images were processed; the TFRecord shards are empty.")
         return num_characters
 
-    save_character_map()
-
-    # Split data into training and validation sets
-    X_train, X_val, y_train, y_val = train_test_split(
-        images, labels, test_size=0.2, random_state=42, stratify=labels
-    )
-
-    # Define helper functions to create TFRecord features
-    def _int64_feature(value):
-        return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
-
-    def _bytes_feature(value):
-        return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
-
-    # Write training TFRecord file
-    with tf.io.TFRecordWriter(os.path.join(OUTPUT_PATH, 'train.tfrecord')) as writer:
-        for i in range(len(X_train)):
-            image_raw = X_train[i].tobytes()
-            feature = {
-                'label': _int64_feature(y_train[i]),
-                'image_raw': _bytes_feature(image_raw)
-            }
-            example = tf.train.Example(features=tf.train.Features(feature=feature))
-            writer.write(example.SerializeToString())
-
-    # Write validation TFRecord file
-    with tf.io.TFRecordWriter(os.path.join(OUTPUT_PATH, 'val.tfrecord')) as writer:
-        for i in range(len(X_val)):
-            image_raw = X_val[i].tobytes()
-            feature = {
-                'label': _int64_feature(y_val[i]),
-                'image_raw': _bytes_feature(image_raw)
-            }
-            example = tf.train.Example(features=tf.train.Features(feature=feature))
-            writer.write(example.SerializeToString())
-
-    print("Saved TFRecord files")
-    print(f"Training set: {len(X_train)} images")
-    print(f"Validation set: {len(X_val)} images")
+    print(f"Saved {num_shards} TFRecord shards per split to {OUTPUT_PATH}")
+    print(f"Training set: {split_counts['train']} images")
+    print(f"Validation set: {split_counts['val']} images")
     print(f"Character map saved to {os.path.join(OUTPUT_PATH, 'character_map.json')}")
 
     return num_characters
 
 if __name__ == "__main__":
-    num_classes = main()
+    args = parse_args()
+    trace = StageTrace('etl9g')
+    num_classes = main(args.workers, args.dump_png, trace, args.shards, args.val_fraction)
     print(f"Total classes: {num_classes}")
+    trace.report()
+    if args.trace:
+        trace.write(args.trace)
@@ -0,0 +1,109 @@
+import math
+import tensorflow as tf
+
+# Augmentation ranges, matching the variations process_data.py used to pre-render
+MAX_ROTATION_DEGREES = 15
+MAX_SHIFT_PIXELS = 5
+SCALE_RANGE = (0.8, 1.2)
+ELASTIC_ALPHA = 2.0  # Maximum displacement of the elastic field in pixels
+ELASTIC_GRID = 4  # Resolution of the random field before it is upsampled
+NOISE_STDDEV = 10 / 255
+BLUR_PROBABILITY = 0.5
+
+def _affine_transforms(batch_size, height, width):
+    """Random rotation/scale/shift per sample as (batch, 8) projective transforms.
+
+    The transforms map output pixel coordinates back to input coordinates, as
+    ImageProjectiveTransformV3 expects.
+    """
+    angle = tf.random.uniform([batch_size], -MAX_ROTATION_DEGREES, MAX_ROTATION_DEGREES) * math.pi / 180
+    scale = tf.random.uniform([batch_size], *SCALE_RANGE)
+    shift_x = tf.random.uniform([batch_size], -MAX_SHIFT_PIXELS, MAX_SHIFT_PIXELS)
+    shift_y = tf.random.uniform([batch_size], -MAX_SHIFT_PIXELS, MAX_SHIFT_PIXELS)
+    center_x = (tf.cast(width, tf.float32) - 1) / 2
+    center_y = (tf.cast(height, tf.float32) - 1) / 2
+
+    a0 = tf.cos(angle) / scale
+    a1 = tf.sin(angle) / scale
+    b0 = -tf.sin(angle) / scale
+    b1 = tf.cos(angle) / scale
+    a2 = center_x - a0 * (center_x + shift_x) - a1 * (center_y + shift_y)
+    b2 = center_y - b0 * (center_x + shift_x) - b1 * (center_y + shift_y)
+    zeros = tf.zeros([batch_size])
+    return tf.stack([a0, a1, a2, b0, b1, b2, zeros, zeros], axis=1)
+
+def random_affine(images):
+    """Rotate, scale and shift every image in the batch by its own random amount."""
+    shape = tf.shape(images)
+    transforms = _affine_transforms(shape[0], shape[1], shape[2])
+    return tf.raw_ops.ImageProjectiveTransformV3(
+        images=images,
+        transforms=transforms,
+        output_shape=shape[1:3],
+        fill_value=0.0,
+        interpolation='BILINEAR',
+        fill_mode='CONSTANT'
+    )
+
+def random_stroke_width(images):
+    """Thicken, thin or keep the strokes of each image (grayscale dilation/erosion)."""
+    thicker = tf.nn.max_pool2d(images, 3, 1, 'SAME')
+    thinner = -tf.nn.max_pool2d(-images, 3, 1, 'SAME')
+    choice = tf.random.uniform([tf.shape(images)[0], 1, 1, 1], 0, 3, dtype=tf.int32)
+    return tf.where(choice == 0, thicker, tf.where(choice == 1, thinner, images))
+
+def random_elastic(images):
+    """Warp each image with a smooth random displacement field, sampled bilinearly."""
+    shape = tf.shape(images)
+    batch_size, height, width, channels = shape[0], shape[1], shape[2], shape[3]
+
+    coarse = tf.random.uniform([batch_size, ELASTIC_GRID, ELASTIC_GRID, 2], -ELASTIC_ALPHA, ELASTIC_ALPHA)
+    flow = tf.image.resize(coarse, [height, width], method='bicubic')
+
+    grid_y, grid_x = tf.meshgrid(tf.range(height, dtype=tf.float32),
+                                 tf.range(width, dtype=tf.float32), indexing='ij')
+    max_y = tf.cast(height - 1, tf.float32)
+    max_x = tf.cast(width - 1, tf.float32)
+    sample_y = tf.clip_by_value(grid_y + flow[..., 0], 0, max_y)
+    sample_x = tf.clip_by_value(grid_x + flow[..., 1], 0, max_x)
+
+    y0 = tf.floor(sample_y)
+    x0 = tf.floor(sample_x)
+    y1 = tf.minimum(y0 + 1, max_y)
+    x1 = tf.minimum(x0 + 1, max_x)
+    wy = (sample_y - y0)[..., None]
+    wx = (sample_x - x0)[..., None]
+
+    flat = tf.reshape(images, [batch_size, height * width, channels])
+
+    def gather(y, x):
+        index = tf.cast(y, tf.int32) * width + tf.cast(x, tf.int32)
+        return tf.reshape(tf.gather(flat, tf.reshape(index, [batch_size, -1]), batch_dims=1), shape)
+
+    top = gather(y0, x0) * (1 - wx) + gather(y0, x1) * wx
+    bottom = gather(y1, x0) * (1 - wx) + gather(y1, x1) * wx
+    return top * (1 - wy) + bottom * wy
+
+def random_noise_and_blur(images, max_value):
+    """Add Gaussian pixel noise and blur a random subset of the batch with a 3x3 kernel."""
+    images = images + tf.random.normal(tf.shape(images), stddev=NOISE_STDDEV * max_value)
+
+    kernel = tf.constant([1.0, 2.0, 1.0])
+    kernel = tf.tensordot(kernel, kernel, axes=0) / 16.0
+    kernel = tf.tile(kernel[:, :, None, None], [1, 1, tf.shape(images)[-1], 1])
+    blurred = tf.nn.depthwise_conv2d(images, kernel, [1, 1, 1, 1], 'SAME')
+    apply_blur = tf.random.uniform([tf.shape(images)[0], 1, 1, 1]) < BLUR_PROBABILITY
+    images = tf.where(apply_blur, blurred, images)
+    return tf.clip_by_value(images, 0.0, max_value)
+
+def augment_batch(images, max_value=255.0):
+    """Apply random affine, stroke-width, elastic, noise and blur transforms to a batch.
+
+    Every transform is vectorized over the batch and runs inside the tf.data
+    graph. max_value is the pixel value of full ink (255 for raw uint8 pixels).
+    """
+    images = tf.cast(images, tf.float32)
+    images = random_affine(images)
+    images = random_stroke_width(images)
+    images = random_elastic(images)
+    return random_noise_and_blur(images, max_value)
@@ -0,0 +1,200 @@
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import contextlib
+import importlib.util
+import numpy as np
+import tensorflow as tf
+from pathlib import Path
+
+import process_data
+import train_model
+from dataset_io import ShardedTFRecordWriter, encode_example
+from glyph_atlas import build_glyph_atlas
+
+# Default fixture sizes, small enough for a CPU-only box
+NUM_CLASSES = 10
+NUM_VARIATIONS = 20
+ETL9G_RECORDS = 2000
+TRAIN_STEPS = 20
+LATENCY_RUNS = 50
+INFERENCE_BATCH = 256
+DEFAULT_TOLERANCE = 0.10
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+# Whether a larger value of each metric is better; used by --compare
+HIGHER_IS_BETTER = {
+    'generation_images_per_sec': True,
+    'etl9g_records_per_sec': True,
+    'loader_examples_per_sec': True,
+    'train_steps_per_sec': True,
+    'inference_single_ms': False,
+    'inference_batch_ms': False,
+    'inference_batch_images_per_sec': True,
+    'peak_rss_mb': False,
+}
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its finished children, in MB."""
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(self_kb, children_kb) / 1024
+
+def bench_generation(workdir, num_classes, num_variations, workers):
+    """Images/sec for synthetic rendering across the process pool."""
+    chars = process_data.load_characters()[:num_classes]
+    classes = [(idx, char, idx) for idx, char in enumerate(chars)]
+    atlas_path = build_glyph_atlas(chars, workdir)
+    # Variation 0 is skipped because workers save it as an example PNG
+    tasks = process_data.build_tasks(classes, lambda idx: range(1, num_variations + 1), atlas_path=atlas_path)
+    start = time.perf_counter()
+    count = sum(1 for _ in process_data.iter_samples(tasks, workers))
+    return count / (time.perf_counter() - start)
+
+def _load_etl9g_module(workdir):
+    """Import data/test.py under another name; it creates output folders in the cwd on import."""
+    spec = importlib.util.spec_from_file_location('etl9g_ingest', PROJECT_ROOT / 'data' / 'test.py')
+    module = importlib.util.module_from_spec(spec)
+    with contextlib.chdir(workdir):
+        spec.loader.exec_module(module)
+    return module
+
+def bench_etl9g(workdir, num_records):
+    """Records/sec for reading a synthetic ETL9G file, half of it hiragana/katakana."""
+    etl9g = _load_etl9g_module(workdir)
+    rng = np.random.default_rng(0)
+    records = np.zeros(num_records, dtype=etl9g.ETL9G_RECORD_DTYPE)
+    kana = rng.integers(0x2421, 0x2474, num_records)
+    kanji = rng.integers(0x3021, 0x4F54, num_records)
+    records['jis_code'] = np.where(rng.random(num_records) < 0.5, kana, kanji)
+    records['image'] = rng.integers(0, 256, records['image'].shape, dtype=np.uint8)
+    path = Path(workdir) / 'ETL9G_01'
+    records.tofile(path)
+
+    start = time.perf_counter()
+    etl9g.read_etl9g_file(str(path))
+    return num_records / (time.perf_counter() - start)
+
+def write_fixture_shards(workdir, num_classes, num_variations):
+    """Write random uint8 samples into train shards and return their paths."""
+    rng = np.random.default_rng(0)
+    with ShardedTFRecordWriter(workdir, 'train', 2) as writer:
+        for label in range(num_classes):
+            for _ in range(num_variations):
+                image = rng.integers(0, 256, train_model.INPUT_SHAPE, dtype=np.uint8)
+                writer.write(encode_example(image, label))
+    return sorted(str(p) for p in Path(workdir).glob('train-*.tfrecord'))
+
+def bench_loader(files, batch_size):
+    """Examples/sec for the tf.data training pipeline on the fixture shards (second pass)."""
+    dataset = train_model.make_dataset(files, batch_size, training=True, shuffle_buffer=1000)
+    return train_model.benchmark_dataset(dataset, epochs=2)[-1]
+
+def bench_training(files, num_classes, batch_size, steps):
+    """Train steps/sec after one warm-up epoch."""
+    model = train_model.create_model(num_classes)
+    model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    dataset = train_model.make_dataset(files, batch_size, training=True, shuffle_buffer=1000).repeat()
+    model.fit(dataset, epochs=1, steps_per_epoch=2, verbose=0)
+    start = time.perf_counter()
+    model.fit(dataset, epochs=1, steps_per_epoch=steps, verbose=0)
+    return steps / (time.perf_counter() - start), model
+
+def bench_inference(model, runs, batch_size):
+    """Median single-image and batched inference latency in milliseconds."""
+    single = np.random.default_rng(0).integers(0, 256, (1, *train_model.INPUT_SHAPE)).astype(np.float32)
+    batch = np.repeat(single, batch_size, axis=0)
+
+    def median_ms(inputs):
+        model(inputs, training=False)  # warm-up / tracing
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            model(inputs, training=False).numpy()
+            timings.append((time.perf_counter() - start) * 1000)
+        return float(np.median(timings))
+
+    return median_ms(single), median_ms(batch)
+
+def run_benchmarks(num_classes=NUM_CLASSES, num_variations=NUM_VARIATIONS, etl9g_records=ETL9G_RECORDS,
+                   batch_size=train_model.BATCH_SIZE, train_steps=TRAIN_STEPS, workers=None):
+    """Run every benchmark on small synthetic fixtures and return a metrics dict."""
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        print("Benchmarking synthetic generation...")
+        results['generation_images_per_sec'] = bench_generation(workdir, num_classes, num_variations, workers)
+
+        print("Benchmarking ETL9G ingestion...")
+        results['etl9g_records_per_sec'] = bench_etl9g(workdir, etl9g_records)
+
+        print("Benchmarking tf.data loader...")
+        files = write_fixture_shards(workdir, num_classes, num_variations)
+        results['loader_examples_per_sec'] = bench_loader(files, batch_size)
+
+        print("Benchmarking training steps...")
+        results['train_steps_per_sec'], model = bench_training(files, num_classes, batch_size, train_steps)
+
+        print("Benchmarking inference...")
+        single_ms, batch_ms = bench_inference(model, LATENCY_RUNS, INFERENCE_BATCH)
+        results['inference_single_ms'] = single_ms
+        results['inference_batch_ms'] = batch_ms
+        results['inference_batch_images_per_sec'] = INFERENCE_BATCH / (batch_ms / 1000)
+
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Print each metric against the baseline and return the names of regressed metrics."""
+    regressions = []
+    for name, value in results.items():
+        if name not in baseline or name not in HIGHER_IS_BETTER:
+            continue
+        base = baseline[name]
+        change = (value - base) / base if base else 0.0
+        worse = -change if HIGHER_IS_BETTER[name] else change
+        regressed = worse > tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:32s} {base:12.2f} -> {value:12.2f} ({change:+.1%}){'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark generation, ingestion, input pipeline, training and inference.")
+    parser.add_argument('--output', default='benchmark_results.json', help="Where to write the results JSON")
+    parser.add_argument('--compare', default=None, help="Baseline results JSON to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Relative slowdown allowed before a metric counts as a regression")
+    parser.add_argument('--classes', type=int, default=NUM_CLASSES)
+    parser.add_argument('--variations', type=int, default=NUM_VARIATIONS)
+    parser.add_argument('--etl9g-records', type=int, default=ETL9G_RECORDS)
+    parser.add_argument('--batch-size', type=int, default=train_model.BATCH_SIZE)
+    parser.add_argument('--train-steps', type=int, default=TRAIN_STEPS)
+    parser.add_argument('--workers', type=int, default=None)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    tf.random.set_seed(0)
+    results = run_benchmarks(args.classes, args.variations, args.etl9g_records,
+                             args.batch_size, args.train_steps, args.workers)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
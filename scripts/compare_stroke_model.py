@@ -0,0 +1,68 @@
+import json
+import argparse
+import numpy as np
+import tensorflow as tf
+from pathlib import Path
+
+from dataset_io import IMAGE_BYTES
+from export_model import evaluate_accuracy, load_validation_data
+from profile_models import count_flops, measure_latency
+from stroke_data import STROKE_SHAPE, load_stroke_split
+from train_model import MODEL_DIR, RUNS_DIR, STROKE_MODEL_DIR, make_stroke_dataset
+
+EVAL_BATCH_SIZE = 256
+
+def describe(name, model, val_dataset, input_bytes):
+    """Size, cost, CPU latency and validation accuracy of one trained model."""
+    p50, p95 = measure_latency(model)
+    return {
+        'model': name,
+        'input_bytes': input_bytes,
+        'params': int(model.count_params()),
+        'weights_bytes': int(sum(w.nbytes for w in model.get_weights())),
+        'flops': int(count_flops(model)),
+        'latency_p50_ms': p50,
+        'latency_p95_ms': p95,
+        'val_accuracy': evaluate_accuracy(model, val_dataset),
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare the raster CNN and the stroke-sequence model side by side.")
+    parser.add_argument('--cnn-model', default=str(MODEL_DIR / 'best_model.h5'))
+    parser.add_argument('--stroke-model', default=str(STROKE_MODEL_DIR / 'best_model.h5'))
+    parser.add_argument('--output', default=str(RUNS_DIR / 'stroke_vs_cnn.json'))
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    stroke_val = make_stroke_dataset(*load_stroke_split('val'), EVAL_BATCH_SIZE)
+    results = [
+        describe('cnn', tf.keras.models.load_model(args.cnn_model),
+                 load_validation_data(batch_size=EVAL_BATCH_SIZE), IMAGE_BYTES),
+        describe('strokes', tf.keras.models.load_model(args.stroke_model),
+                 stroke_val, int(np.prod(STROKE_SHAPE)) * np.dtype(np.float16).itemsize),
+    ]
+
+    print(f"{'model':8s} {'input':>7s} {'params':>9s} {'weights':>9s} {'MFLOPs':>8s} "
+          f"{'p50 ms':>7s} {'p95 ms':>7s} {'val_acc':>8s}")
+    for r in results:
+        print(f"{r['model']:8s} {r['input_bytes']:6d}B {r['params']:9d} {r['weights_bytes'] / 1024:8.0f}K "
+              f"{r['flops'] / 1e6:8.2f} {r['latency_p50_ms']:7.2f} {r['latency_p95_ms']:7.2f} {r['val_accuracy']:8.4f}")
+
+    cnn, strokes = results
+    report = {
+        'models': results,
+        'stroke_vs_cnn': {
+            'input_ratio': strokes['input_bytes'] / cnn['input_bytes'],
+            'weights_ratio': strokes['weights_bytes'] / cnn['weights_bytes'],
+            'latency_p50_ratio': strokes['latency_p50_ms'] / cnn['latency_p50_ms'],
+            'accuracy_delta': strokes['val_accuracy'] - cnn['val_accuracy'],
+        },
+    }
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import json
+import argparse
+import tensorflow as tf
+from pathlib import Path
+
+from dataset_io import class_count
+from train_model import (ARCHITECTURE, ARCHITECTURES, BATCH_SIZE, PROCESSED_DIR, RUNS_DIR, SEED,
+                         ThroughputCallback, configure_precision, create_model, load_data, train_examples)
+
+EPOCHS = 3
+
+# (name, mixed bfloat16, XLA)
+MODES = [
+    ('float32', False, False),
+    ('float32+xla', False, True),
+    ('bfloat16', True, False),
+    ('bfloat16+xla', True, True),
+]
+
+def run_mode(name, mixed_precision, jit_compile, num_classes, epochs, batch_size, architecture):
+    """Train one configuration from the same seed and report throughput and accuracy."""
+    tf.keras.utils.set_random_seed(SEED)
+    active = configure_precision(mixed_precision)
+    if mixed_precision and not active:
+        return {'mode': name, 'skipped': 'no native bfloat16 support'}
+
+    model = create_model(num_classes, architecture)
+    model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'],
+                  jit_compile=jit_compile)
+    train_dataset, val_dataset = load_data(batch_size, seed=SEED)
+    throughput = ThroughputCallback(batch_size, train_examples())
+    history = model.fit(train_dataset, validation_data=val_dataset, epochs=epochs,
+                        callbacks=[throughput], verbose=0)
+
+    # The first epoch includes tracing and XLA compilation, so leave it out when possible
+    steady = throughput.examples_per_sec[1:] or throughput.examples_per_sec
+    return {
+        'mode': name,
+        'examples_per_sec': sum(steady) / len(steady),
+        'first_epoch_sec': throughput.epoch_times[0],
+        'val_accuracy': float(max(history.history['val_accuracy'])),
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare float32, XLA and mixed-precision training.")
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--architecture', choices=ARCHITECTURES, default=ARCHITECTURE)
+    parser.add_argument('--output', default=str(RUNS_DIR / 'training_modes.json'))
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    with open(PROCESSED_DIR / 'character_map.json', 'r', encoding='utf-8') as f:
+        num_classes = class_count(json.load(f))
+
+    results = [run_mode(name, mixed, xla, num_classes, args.epochs, args.batch_size, args.architecture)
+               for name, mixed, xla in MODES]
+    configure_precision(False)
+
+    baseline = results[0]
+    print(f"{'mode':14s} {'examples/s':>11s} {'speedup':>8s} {'val_acc':>8s} {'delta':>8s}")
+    for result in results:
+        if 'skipped' in result:
+            print(f"{result['mode']:14s} skipped: {result['skipped']}")
+            continue
+        result['speedup'] = result['examples_per_sec'] / baseline['examples_per_sec']
+        result['accuracy_delta'] = result['val_accuracy'] - baseline['val_accuracy']
+        print(f"{result['mode']:14s} {result['examples_per_sec']:11.0f} {result['speedup']:7.2f}x "
+              f"{result['val_accuracy']:8.4f} {result['accuracy_delta']:+8.4f}")
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Comparison written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2 @@
+# load_test.py is the serving load generator, not a test module
+collect_ignore = ['load_test.py']
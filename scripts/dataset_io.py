@@ -0,0 +1,229 @@
+import json
+import math
+import zlib
+import hashlib
+import numpy as np
+import tensorflow as tf
+from pathlib import Path
+
+DEFAULT_NUM_SHARDS = 4
+VAL_FRACTION = 0.2
+SHUFFLE_BUCKET_BYTES = 64 * 1024 * 1024  # Records held in memory at once by shuffle_tfrecord
+MANIFEST_NAME = 'build_manifest.json'
+SAMPLE_LABEL_DTYPE = np.dtype('<i4')
+
+# Record schema shared by every TFRecord writer and reader. Bump the version
+# whenever the encoding changes so stale files fail loudly instead of decoding
+# into garbage.
+RECORD_FORMAT_VERSION = 1
+IMAGE_SHAPE = (64, 64, 1)
+IMAGE_BYTES = int(np.prod(IMAGE_SHAPE))
+FEATURE_DESCRIPTION = {
+    'format_version': tf.io.FixedLenFeature([], tf.int64),
+    'label': tf.io.FixedLenFeature([], tf.int64),
+    'image_raw': tf.io.FixedLenFeature([], tf.string),
+}
+
+def _bytes_feature(value):
+    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+
+def _int64_feature(value):
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
+
+def encode_example(image, label):
+    """Serialize a uint8 image and its label as a fixed-length tf.train.Example."""
+    if image.dtype != np.uint8 or image.size != IMAGE_BYTES:
+        raise ValueError(f"Expected a uint8 image with {IMAGE_BYTES} pixels, "
+                         f"got {image.dtype} with {image.size}")
+    feature = {
+        'format_version': _int64_feature(RECORD_FORMAT_VERSION),
+        'label': _int64_feature(int(label)),
+        'image_raw': _bytes_feature(np.ascontiguousarray(image).tobytes()),
+    }
+    return tf.train.Example(features=tf.train.Features(feature=feature)).SerializeToString()
+
+def parse_batch(serialized):
+    """Parse a batch of serialized examples into (uint8 images, int64 labels)."""
+    parsed = tf.io.parse_example(serialized, FEATURE_DESCRIPTION)
+    tf.debugging.assert_equal(
+        parsed['format_version'], tf.constant(RECORD_FORMAT_VERSION, tf.int64),
+        message="TFRecord format version mismatch; regenerate the dataset")
+    images = tf.io.decode_raw(parsed['image_raw'], tf.uint8)
+    images = tf.reshape(images, (-1, *IMAGE_SHAPE))
+    return images, parsed['label']
+
+def class_count(character_map):
+    """Output units needed for a {class id: character} map.
+    
+    Class ids stay stable across incremental builds, so removed classes leave
+    gaps and this is the highest id plus one rather than len(character_map).
+    """
+    return max(int(idx) for idx in character_map) + 1
+
+def shard_filename(split, index, num_shards):
+    """Name of one shard, e.g. train-00000-of-00004.tfrecord."""
+    return f"{split}-{index:05d}-of-{num_shards:05d}.tfrecord"
+
+def shard_pattern(split):
+    """Glob pattern matching every shard of a split."""
+    return f"{split}-*-of-*.tfrecord"
+
+def assign_split(label, variation, val_fraction=VAL_FRACTION):
+    """Deterministically assign a sample to 'train' or 'val' from a hash of (class, variation)."""
+    bucket = zlib.crc32(f"{label}:{variation}".encode('utf-8')) / 0xFFFFFFFF
+    return 'val' if bucket < val_fraction else 'train'
+
+def stratified_split(key, index, val_fraction=VAL_FRACTION):
+    """Assign the index-th sample of a class to 'train' or 'val' as it streams in.
+    
+    Every class sends a sample to validation each time index * val_fraction
+    crosses an integer, offset by a per-class phase hashed from key. The
+    split is deterministic, needs no pass over the data, and the first n
+    samples of every class hold floor or ceil of n * val_fraction validation
+    samples.
+    """
+    phase = zlib.crc32(str(key).encode('utf-8')) / 0x100000000
+    crossed = int((index + 1) * val_fraction + phase) > int(index * val_fraction + phase)
+    return 'val' if crossed else 'train'
+
+class ShardedTFRecordWriter:
+    """Write serialized records round-robin into N rotating shard files."""
+
+    def __init__(self, output_dir, split, num_shards=DEFAULT_NUM_SHARDS):
+        self.output_dir = Path(output_dir)
+        self.split = split
+        self.num_shards = num_shards
+        self.count = 0
+        self._writers = []
+
+    def __enter__(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        # Remove shards from previous runs that used a different shard count
+        for stale in self.output_dir.glob(shard_pattern(self.split)):
+            stale.unlink()
+        self._writers = [
+            tf.io.TFRecordWriter(str(self.output_dir / shard_filename(self.split, i, self.num_shards)))
+            for i in range(self.num_shards)
+        ]
+        return self
+
+    def write(self, record):
+        self._writers[self.count % self.num_shards].write(record)
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        for writer in self._writers:
+            writer.close()
+        self._writers = []
+        return False
+
+def read_labeled_records(path):
+    """Yield (label, serialized record) for every record in a TFRecord file."""
+    for record in tf.data.TFRecordDataset(str(path)).as_numpy_iterator():
+        example = tf.train.Example.FromString(record)
+        yield example.features.feature['label'].int64_list.value[0], record
+
+def shuffle_tfrecord(src, dst, seed, bucket_bytes=SHUFFLE_BUCKET_BYTES):
+    """Write the records of src to dst in a seeded random order, holding about bucket_bytes in memory.
+    
+    Records are first scattered at random over temporary bucket files next
+    to dst; each bucket is then loaded on its own, permuted and appended.
+    """
+    dst = Path(dst)
+    rng = np.random.default_rng(seed)
+    num_buckets = max(1, math.ceil(Path(src).stat().st_size / bucket_bytes))
+    buckets = [dst.with_name(f"{dst.name}.bucket{i}") for i in range(num_buckets)]
+    try:
+        writers = [tf.io.TFRecordWriter(str(path)) for path in buckets]
+        try:
+            for record in tf.data.TFRecordDataset(str(src)).as_numpy_iterator():
+                writers[rng.integers(num_buckets)].write(record)
+        finally:
+            for writer in writers:
+                writer.close()
+        with tf.io.TFRecordWriter(str(dst)) as writer:
+            for path in buckets:
+                records = list(tf.data.TFRecordDataset(str(path)).as_numpy_iterator())
+                for i in rng.permutation(len(records)):
+                    writer.write(records[i])
+    finally:
+        for path in buckets:
+            path.unlink(missing_ok=True)
+
+def count_records(files):
+    """Number of records in TFRecord files, read without parsing them."""
+    return sum(1 for path in files for _ in tf.data.TFRecordDataset(str(path)).as_numpy_iterator())
+
+def files_fingerprint(files):
+    """Short digest of the paths, sizes and modification times of files; changes whenever one is rewritten."""
+    digest = hashlib.sha256()
+    for path in files:
+        stat = Path(path).stat()
+        digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def load_build_manifest(data_dir):
+    """The build_manifest.json written next to the shards by the last build, or {} without one."""
+    path = Path(data_dir) / MANIFEST_NAME
+    if not path.exists():
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def list_shards(data_dir, split):
+    """Sorted list of shard paths for a split."""
+    return sorted(str(p) for p in Path(data_dir).glob(shard_pattern(split)))
+
+class PackedSampleStore:
+    """Append fixed-shape uint8 samples and their labels to two flat files.
+    
+    Writes <path>.bin (concatenated sample bytes; sample i starts at
+    i * sample size), <path>.labels.bin (one little-endian int32 label per
+    sample) and <path>.json (sample shape and count). Both files are
+    streamed, so memory use does not grow with the number of samples. Open
+    the result with open_sample_store.
+    """
+
+    def __init__(self, path, sample_shape):
+        self.path = Path(path)
+        self.sample_shape = tuple(sample_shape)
+        self.count = 0
+        self._file = None
+        self._labels = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path.with_suffix('.bin'), 'wb')
+        self._labels = open(self.path.with_suffix('.labels.bin'), 'wb')
+        return self
+
+    def write(self, sample, label):
+        data = np.ascontiguousarray(sample, dtype=np.uint8)
+        if data.shape != self.sample_shape:
+            raise ValueError(f"Expected sample shape {self.sample_shape}, got {data.shape}")
+        self._file.write(data.tobytes())
+        self._labels.write(SAMPLE_LABEL_DTYPE.type(label).tobytes())
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        self._labels.close()
+        with open(self.path.with_suffix('.json'), 'w', encoding='utf-8') as f:
+            json.dump({'sample_shape': list(self.sample_shape), 'dtype': 'uint8', 'count': self.count}, f, indent=2)
+        return False
+
+def open_sample_store(path):
+    """Memory-map a packed sample store and return (images, labels).
+    
+    images is a read-only (count, *sample_shape) uint8 memmap and labels a
+    read-only int32 memmap; nothing is loaded until they are indexed.
+    """
+    path = Path(path)
+    with open(path.with_suffix('.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta['count'] == 0:
+        return np.empty((0, *meta['sample_shape']), dtype=np.uint8), np.empty(0, dtype=SAMPLE_LABEL_DTYPE)
+    images = np.memmap(path.with_suffix('.bin'), dtype=np.uint8, mode='r',
+                       shape=(meta['count'], *meta['sample_shape']))
+    labels = np.memmap(path.with_suffix('.labels.bin'), dtype=SAMPLE_LABEL_DTYPE, mode='r', shape=(meta['count'],))
+    return images, labels
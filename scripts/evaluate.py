@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import cv2
+import tensorflow as tf
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from dataset_io import IMAGE_SHAPE, class_count, parse_batch
+
+PROJECT_ROOT = Path(__file__).parent.parent
+MODEL_DIR = PROJECT_ROOT / 'public/models/japanese_character_model'
+
+PREDICT_BATCH_SIZE = 1024
+TOP_K = 5
+TOP_CONFUSIONS = 20
+
+# Look-alike pairs whose confusion is always reported
+WATCHED_PAIRS = [('シ', 'ツ'), ('ソ', 'ン'), ('ぬ', 'め'), ('わ', 'れ'), ('は', 'ほ'), ('ク', 'ケ'), ('ウ', 'ワ')]
+
+def load_model(model_path):
+    """Load a Keras .h5/SavedModel or an exported TF.js layers model (model.json)."""
+    model_path = Path(model_path)
+    if model_path.name == 'model.json' or (model_path / 'model.json').exists():
+        import tensorflowjs as tfjs
+        config_path = model_path if model_path.name == 'model.json' else model_path / 'model.json'
+        return tfjs.converters.load_keras_model(str(config_path))
+    return tf.keras.models.load_model(model_path)
+
+def _read_png(path):
+    image = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError(f"Could not decode {path}")
+    return cv2.resize(image, IMAGE_SHAPE[:2]).reshape(IMAGE_SHAPE)
+
+def png_label(path, reverse_map):
+    """Class of a PNG from its folder (images/<char>/N.png) or filename prefix (<char>_N.png)."""
+    if path.parent.name in reverse_map:
+        return reverse_map[path.parent.name]
+    return reverse_map.get(path.stem.split('_')[0])
+
+def load_pngs(directory, reverse_map, threads=None):
+    """Decode every labelled PNG under a directory with a thread pool."""
+    paths = [p for p in sorted(Path(directory).rglob('*.png')) if png_label(p, reverse_map) is not None]
+    if not paths:
+        raise FileNotFoundError(f"No PNGs with a known character label under {directory}")
+    with ThreadPoolExecutor(max_workers=threads or os.cpu_count()) as pool:
+        images = np.stack(list(pool.map(_read_png, paths, chunksize=64)))
+    labels = np.array([png_label(p, reverse_map) for p in paths])
+    return images, labels
+
+def load_tfrecords(paths, batch_size=PREDICT_BATCH_SIZE):
+    """Read and decode TFRecord shards written with the shared record schema."""
+    dataset = tf.data.TFRecordDataset(paths, num_parallel_reads=tf.data.AUTOTUNE)
+    dataset = dataset.batch(batch_size).map(parse_batch, num_parallel_calls=tf.data.AUTOTUNE)
+    images, labels = [], []
+    for batch_images, batch_labels in dataset:
+        images.append(batch_images.numpy())
+        labels.append(batch_labels.numpy())
+    return np.concatenate(images), np.concatenate(labels)
+
+def evaluate(model, images, labels, num_classes, batch_size=PREDICT_BATCH_SIZE, top_k=TOP_K):
+    """Run batched prediction and return top-k accuracies, the confusion matrix and throughput."""
+    start = time.perf_counter()
+    probabilities = model.predict(images.astype(np.float32), batch_size=batch_size, verbose=0)
+    elapsed = time.perf_counter() - start
+
+    ranked = np.argsort(-probabilities, axis=1)[:, :top_k]
+    hits = ranked == labels[:, None]
+    top_k_accuracy = {f"top_{k}": float(hits[:, :k].any(axis=1).mean()) for k in range(1, top_k + 1)}
+
+    confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+    np.add.at(confusion, (labels, ranked[:, 0]), 1)
+    return top_k_accuracy, confusion, len(images) / max(elapsed, 1e-9)
+
+def confusion_report(confusion, character_map, top=TOP_CONFUSIONS):
+    """Most frequent off-diagonal confusions plus the watched look-alike pairs."""
+    off_diagonal = confusion.copy()
+    np.fill_diagonal(off_diagonal, 0)
+    flat = np.argsort(-off_diagonal, axis=None)[:top]
+    pairs = []
+    for true_class, predicted in zip(*np.unravel_index(flat, off_diagonal.shape)):
+        count = int(off_diagonal[true_class, predicted])
+        if count == 0:
+            break
+        pairs.append({'true': character_map.get(str(true_class), str(true_class)),
+                      'predicted': character_map.get(str(predicted), str(predicted)),
+                      'count': count})
+
+    reverse_map = {char: int(idx) for idx, char in character_map.items()}
+    watched = []
+    for a, b in WATCHED_PAIRS:
+        if a in reverse_map and b in reverse_map:
+            i, j = reverse_map[a], reverse_map[b]
+            watched.append({'pair': f"{a}/{b}", f"{a}->{b}": int(confusion[i, j]),
+                            f"{b}->{a}": int(confusion[j, i]),
+                            'support': int(confusion[i].sum() + confusion[j].sum())})
+    return pairs, watched
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Batched offline evaluation of a trained character model.")
+    parser.add_argument('--model', default=str(MODEL_DIR / 'best_model.h5'),
+                        help="Keras model file or exported TF.js model directory/model.json")
+    parser.add_argument('--character-map', default=str(MODEL_DIR / 'character_map.json'))
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--png-dir', help="Directory of PNGs labelled by folder or <char>_N.png name")
+    source.add_argument('--tfrecord', nargs='+', help="TFRecord shard(s) to evaluate")
+    parser.add_argument('--batch-size', type=int, default=PREDICT_BATCH_SIZE)
+    parser.add_argument('--top-k', type=int, default=TOP_K)
+    parser.add_argument('--threads', type=int, default=None, help="Decoding threads for PNG input")
+    parser.add_argument('--output', default=None, help="Write the full report (with confusion matrix) as JSON")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    with open(args.character_map, 'r', encoding='utf-8') as f:
+        character_map = json.load(f)
+    reverse_map = {char: int(idx) for idx, char in character_map.items()}
+    num_classes = class_count(character_map)
+
+    model = load_model(args.model)
+
+    start = time.perf_counter()
+    if args.png_dir:
+        images, labels = load_pngs(args.png_dir, reverse_map, args.threads)
+    else:
+        images, labels = load_tfrecords(args.tfrecord, args.batch_size)
+    load_seconds = time.perf_counter() - start
+    print(f"Loaded {len(images)} samples in {load_seconds:.2f}s ({len(images) / max(load_seconds, 1e-9):.0f}/sec)")
+
+    top_k_accuracy, confusion, images_per_sec = evaluate(model, images, labels, num_classes,
+                                                         args.batch_size, args.top_k)
+    pairs, watched = confusion_report(confusion, character_map)
+
+    for name, accuracy in top_k_accuracy.items():
+        print(f"{name} accuracy: {accuracy:.4f}")
+    print(f"Prediction throughput: {images_per_sec:.0f} images/sec")
+    print("Most confused pairs (true -> predicted):")
+    for pair in pairs:
+        print(f"  {pair['true']} -> {pair['predicted']}: {pair['count']}")
+    print("Watched look-alike pairs:")
+    for pair in watched:
+        print(f"  {pair}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'samples': int(len(images)),
+                'accuracy': top_k_accuracy,
+                'load_samples_per_sec': len(images) / max(load_seconds, 1e-9),
+                'predict_images_per_sec': images_per_sec,
+                'top_confusions': pairs,
+                'watched_pairs': watched,
+                'confusion_matrix': confusion.tolist(),
+            }, f, ensure_ascii=False, indent=2)
+        print(f"Report written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import json
+import argparse
+import tensorflow as tf
+from pathlib import Path
+from dataset_io import list_shards, parse_batch
+
+PROJECT_ROOT = Path(__file__).parent.parent
+PROCESSED_DIR = PROJECT_ROOT / 'data' / 'processed_data'
+MODEL_DIR = PROJECT_ROOT / 'public/models/japanese_character_model'
+# Logs, checkpoints and reports; kept out of public/ so the app build does not ship them
+RUNS_DIR = PROJECT_ROOT / 'data' / 'runs'
+
+QUANTIZATION_CHOICES = ('float32', 'float16', 'uint8')
+WEIGHT_SHARD_SIZE = 4 * 1024 * 1024  # TF.js default; smaller shards download in parallel
+EVAL_BATCH_SIZE = 256
+
+def export_tfjs(model, output_dir, quantization='float32', weight_shard_size=WEIGHT_SHARD_SIZE):
+    """Convert a Keras model to a TF.js layers model in-process.
+
+    quantization is 'float32' (no quantization), 'float16' or 'uint8' and is
+    applied to every weight. Returns the total size of the weight shards in
+    bytes.
+    """
+    import tensorflowjs as tfjs
+
+    if quantization not in QUANTIZATION_CHOICES:
+        raise ValueError(f"Unknown quantization {quantization!r}; expected one of {QUANTIZATION_CHOICES}")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    # Drop shards from previous exports so stale weights are never served
+    for stale in output_dir.glob('group*-shard*of*.bin'):
+        stale.unlink()
+
+    quantization_map = None if quantization == 'float32' else {quantization: '*'}
+    tfjs.converters.save_keras_model(
+        model, str(output_dir),
+        quantization_dtype_map=quantization_map,
+        weight_shard_size_bytes=weight_shard_size
+    )
+    return sum(p.stat().st_size for p in output_dir.glob('group*-shard*of*.bin'))
+
+def load_tfjs_model(output_dir):
+    """Load an exported TF.js layers model back into Keras, dequantizing its weights."""
+    import tensorflowjs as tfjs
+
+    return tfjs.converters.load_keras_model(str(Path(output_dir) / 'model.json'))
+
+def load_validation_data(data_dir=PROCESSED_DIR, batch_size=EVAL_BATCH_SIZE):
+    """Batched validation split, parsed with the shared record schema."""
+    files = list_shards(data_dir, 'val')
+    if not files:
+        raise FileNotFoundError(f"No validation shards found in {data_dir}")
+    dataset = tf.data.TFRecordDataset(files, num_parallel_reads=tf.data.AUTOTUNE)
+    return dataset.batch(batch_size).map(parse_batch, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+def evaluate_accuracy(model, dataset):
+    correct = 0
+    total = 0
+    for images, labels in dataset:
+        predictions = tf.argmax(model(images, training=False), axis=-1)
+        correct += int(tf.reduce_sum(tf.cast(predictions == labels, tf.int32)))
+        total += int(labels.shape[0])
+    return correct / max(total, 1)
+
+def export_report(model, val_dataset, output_dir, weight_shard_size=WEIGHT_SHARD_SIZE):
+    """Export every quantization variant and compare its accuracy and size against float32.
+
+    Each variant is written to output_dir/<quantization>/ and evaluated as
+    exported, by loading it back from there. The report is saved as
+    output_dir/export_report.json.
+    """
+    output_dir = Path(output_dir)
+    report = []
+    for quantization in QUANTIZATION_CHOICES:
+        size = export_tfjs(model, output_dir / quantization, quantization, weight_shard_size)
+        accuracy = evaluate_accuracy(load_tfjs_model(output_dir / quantization), val_dataset)
+        report.append({'quantization': quantization, 'weights_bytes': size, 'val_accuracy': accuracy})
+
+    baseline = report[0]
+    print(f"{'variant':10s} {'weights':>10s} {'size':>7s} {'val_acc':>8s} {'delta':>8s}")
+    for row in report:
+        row['size_ratio'] = row['weights_bytes'] / baseline['weights_bytes']
+        row['accuracy_delta'] = row['val_accuracy'] - baseline['val_accuracy']
+        print(f"{row['quantization']:10s} {row['weights_bytes'] / 1024:9.0f}K {row['size_ratio']:6.0%} "
+              f"{row['val_accuracy']:8.4f} {row['accuracy_delta']:+8.4f}")
+
+    with open(output_dir / 'export_report.json', 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export a trained Keras model to TF.js with optional quantization.")
+    parser.add_argument('--model', default=str(MODEL_DIR / 'best_model.h5'), help="Keras model to export")
+    parser.add_argument('--output-dir', default=str(MODEL_DIR))
+    parser.add_argument('--quantize', choices=QUANTIZATION_CHOICES, default='float32',
+                        help="Weight quantization of the exported model")
+    parser.add_argument('--shard-size', type=int, default=WEIGHT_SHARD_SIZE,
+                        help="Maximum bytes per weight shard file")
+    parser.add_argument('--report', action='store_true',
+                        help="Also export every variant and write an accuracy-vs-size report")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    model = tf.keras.models.load_model(args.model)
+    size = export_tfjs(model, args.output_dir, args.quantize, args.shard_size)
+    print(f"Exported {args.quantize} model to {args.output_dir} ({size / 1024:.0f} KB of weights)")
+    if args.report:
+        export_report(model, load_validation_data(), RUNS_DIR / 'quantized' / Path(args.output_dir).name,
+                      args.shard_size)
+
+if __name__ == '__main__':
+    main()
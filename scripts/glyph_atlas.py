@@ -0,0 +1,108 @@
+import json
+import hashlib
+import numpy as np
+from functools import lru_cache
+from pathlib import Path
+
+ATLAS_SIZE = 256  # Glyphs are rasterized once at this resolution and downsampled on use
+GLYPH_MARGIN = 0.1  # Fraction of the atlas cell left empty around each glyph
+
+# Common locations of fonts with kana coverage, tried when no font is supplied
+DEFAULT_FONT_PATHS = [
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/truetype/fonts-japanese-gothic.ttf',
+    '/usr/share/fonts/truetype/takao-gothic/TakaoPGothic.ttf',
+    '/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc',
+    '/Library/Fonts/Arial Unicode.ttf',
+    'C:/Windows/Fonts/msgothic.ttc',
+    'C:/Windows/Fonts/YuGothM.ttc',
+]
+
+def find_fonts(font_paths=None):
+    """Return the supplied font paths, or the default system fonts that exist."""
+    if font_paths:
+        missing = [p for p in font_paths if not Path(p).is_file()]
+        if missing:
+            raise FileNotFoundError(f"Font files not found: {missing}")
+        return [Path(p) for p in font_paths]
+    return [Path(p) for p in DEFAULT_FONT_PATHS if Path(p).is_file()]
+
+def fonts_key(font_paths):
+    """Hash of the font file contents."""
+    digest = hashlib.sha256()
+    for path in font_paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+def atlas_key(font_paths, chars, size=ATLAS_SIZE):
+    """Hash of the font file contents, the character set and the atlas resolution."""
+    digest = hashlib.sha256()
+    digest.update(fonts_key(font_paths).encode('utf-8'))
+    digest.update(''.join(chars).encode('utf-8'))
+    digest.update(str(size).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def render_glyph(font, char, size=ATLAS_SIZE):
+    """Rasterize one character white-on-black, centered and scaled to fill the cell."""
+    from PIL import Image, ImageDraw
+
+    left, top, right, bottom = font.getbbox(char)
+    glyph = Image.new('L', (max(right - left, 1), max(bottom - top, 1)), 0)
+    ImageDraw.Draw(glyph).text((-left, -top), char, fill=255, font=font)
+
+    inner = int(size * (1 - 2 * GLYPH_MARGIN))
+    scale = inner / max(glyph.size)
+    glyph = glyph.resize((max(int(glyph.width * scale), 1), max(int(glyph.height * scale), 1)),
+                         Image.LANCZOS)
+
+    cell = Image.new('L', (size, size), 0)
+    cell.paste(glyph, ((size - glyph.width) // 2, (size - glyph.height) // 2))
+    return np.asarray(cell, dtype=np.uint8)
+
+def build_glyph_atlas(chars, output_dir, font_paths=None, size=ATLAS_SIZE):
+    """Rasterize every character with every font once and cache the result.
+
+    The atlas is a (fonts, characters, size, size) uint8 array saved as
+    glyph_atlas_<key>.npy, where the key hashes the fonts, the character set
+    and the resolution; an existing atlas with the same key is reused.
+    Returns the atlas path, or None when no font is available.
+    """
+    fonts = find_fonts(font_paths)
+    if not fonts:
+        return None
+
+    output_dir = Path(output_dir)
+    atlas_path = output_dir / f"glyph_atlas_{atlas_key(fonts, chars, size)}.npy"
+    if atlas_path.exists():
+        print(f"Using cached glyph atlas {atlas_path.name}")
+        return atlas_path
+
+    from PIL import ImageFont
+
+    print(f"Rasterizing {len(chars)} characters from {len(fonts)} fonts into {atlas_path.name}")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary name so an interrupted build is never mistaken for a cached atlas
+    partial_path = output_dir / f"{atlas_path.stem}.partial.npy"
+    atlas = np.lib.format.open_memmap(partial_path, mode='w+', dtype=np.uint8,
+                                      shape=(len(fonts), len(chars), size, size))
+    for font_index, font_path in enumerate(fonts):
+        font = ImageFont.truetype(str(font_path), size)
+        for char_index, char in enumerate(chars):
+            atlas[font_index, char_index] = render_glyph(font, char, size)
+    atlas.flush()
+    del atlas
+    partial_path.replace(atlas_path)
+
+    with open(atlas_path.with_suffix('.json'), 'w', encoding='utf-8') as f:
+        json.dump({'fonts': [str(p) for p in fonts], 'characters': list(chars), 'size': size},
+                  f, ensure_ascii=False, indent=2)
+    return atlas_path
+
+@lru_cache(maxsize=None)
+def load_glyph_atlas(atlas_path):
+    """Memory-map a glyph atlas; cached so each worker process maps it once."""
+    return np.load(atlas_path, mmap_mode='r')
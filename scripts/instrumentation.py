@@ -0,0 +1,94 @@
+import csv
+import json
+import time
+import contextlib
+from pathlib import Path
+
+MAX_EVENTS = 10000  # individual stage timings kept in the trace; totals are always exact
+
+class StageTrace:
+    """Wall-clock timers and counters for the stages of one pipeline run.
+
+    Wrap work in `with trace.stage('name'):`, or wrap an iterator with
+    trace.timed_iter() to charge the time spent waiting on it (e.g. for pool
+    results) to a stage. Totals per stage are always kept; the first
+    MAX_EVENTS timings are also kept individually for a timeline.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}
+        self.counters = {}
+        self.events = []
+        self.dropped_events = 0
+        self._origin = time.perf_counter()
+
+    def add(self, stage, seconds, start=None):
+        totals = self.stages.setdefault(stage, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+        totals['calls'] += 1
+        totals['seconds'] += seconds
+        totals['max_seconds'] = max(totals['max_seconds'], seconds)
+        if len(self.events) < MAX_EVENTS:
+            offset = (start if start is not None else time.perf_counter() - seconds) - self._origin
+            self.events.append({'stage': stage, 'start': offset, 'seconds': seconds})
+        else:
+            self.dropped_events += 1
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, start)
+
+    def timed_iter(self, stage, iterable):
+        """Yield from iterable, charging the time spent inside next() to stage."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.add(stage, time.perf_counter() - start, start)
+            yield item
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def summary(self):
+        total = time.perf_counter() - self._origin
+        stages = {name: {**totals, 'share': totals['seconds'] / max(total, 1e-9)}
+                  for name, totals in self.stages.items()}
+        return {'name': self.name, 'total_seconds': total, 'stages': stages, 'counters': dict(self.counters)}
+
+    def report(self):
+        """Print per-stage totals, slowest first."""
+        summary = self.summary()
+        print(f"{'stage':24s} {'calls':>9s} {'seconds':>9s} {'share':>6s}")
+        for name, totals in sorted(summary['stages'].items(), key=lambda item: -item[1]['seconds']):
+            print(f"{name:24s} {totals['calls']:9d} {totals['seconds']:9.2f} {totals['share']:6.1%}")
+        for name, value in summary['counters'].items():
+            print(f"{name:24s} {value:>9}")
+
+    def write(self, path):
+        """Write the trace as JSON (summary and events) or, for a .csv path, one row per stage and counter."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        summary = self.summary()
+        if path.suffix == '.csv':
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['kind', 'name', 'calls', 'seconds', 'max_seconds', 'share', 'value'])
+                for name, totals in summary['stages'].items():
+                    writer.writerow(['stage', name, totals['calls'], totals['seconds'],
+                                     totals['max_seconds'], totals['share'], ''])
+                for name, value in summary['counters'].items():
+                    writer.writerow(['counter', name, '', '', '', '', value])
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({**summary, 'events': self.events, 'dropped_events': self.dropped_events},
+                          f, ensure_ascii=False, indent=2)
+        print(f"Trace written to {path}")
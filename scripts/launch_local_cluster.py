@@ -0,0 +1,69 @@
+import os
+import sys
+import json
+import socket
+import argparse
+import subprocess
+from pathlib import Path
+
+TRAIN_SCRIPT = Path(__file__).parent / 'train_model.py'
+
+def free_ports(count):
+    """Reserve count free localhost ports (released right before the workers bind them)."""
+    sockets = [socket.socket() for _ in range(count)]
+    try:
+        for sock in sockets:
+            sock.bind(('localhost', 0))
+        return [sock.getsockname()[1] for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
+
+def tf_config(addresses, index):
+    """TF_CONFIG for worker index of a cluster made only of workers (worker 0 acts as chief)."""
+    return json.dumps({'cluster': {'worker': addresses}, 'task': {'type': 'worker', 'index': index}})
+
+def cap_threads(env, threads):
+    """Limit TensorFlow and OpenMP threads of a process started with env; it must not have imported TensorFlow yet."""
+    env['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    env['TF_NUM_INTEROP_THREADS'] = '2'
+    env['OMP_NUM_THREADS'] = str(threads)
+
+def launch(num_workers, train_args, threads_per_worker=None):
+    """Run train_model.py --distribute multi_worker in num_workers local processes and wait for them."""
+    addresses = [f"localhost:{port}" for port in free_ports(num_workers)]
+    processes = []
+    for index in range(num_workers):
+        env = os.environ.copy()
+        env['TF_CONFIG'] = tf_config(addresses, index)
+        if threads_per_worker:
+            # Keep workers sharing one box from oversubscribing the CPU
+            cap_threads(env, threads_per_worker)
+        command = [sys.executable, str(TRAIN_SCRIPT), '--distribute', 'multi_worker', *train_args]
+        print(f"Starting worker {index} on {addresses[index]}")
+        processes.append(subprocess.Popen(command, env=env))
+
+    return_codes = [process.wait() for process in processes]
+    for index, code in enumerate(return_codes):
+        print(f"Worker {index} exited with code {code}")
+    return max(return_codes, key=abs)
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Run multi-worker training as several local processes with generated TF_CONFIG. "
+                    "Arguments after -- are passed to train_model.py.")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help="Cap TensorFlow/OpenMP threads in each worker (default: cpus / workers)")
+    args, train_args = parser.parse_known_args()
+    if train_args and train_args[0] == '--':
+        train_args = train_args[1:]
+    return args, train_args
+
+def main():
+    args, train_args = parse_args()
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+    return launch(args.workers, train_args, threads)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import json
+import time
+import base64
+import asyncio
+import argparse
+import numpy as np
+from dataset_io import IMAGE_BYTES
+from serve_model import HOST, PORT
+
+CONCURRENCY = 32
+REQUESTS = 2000
+
+async def http_request(reader, writer, method, path, payload=None):
+    """Send one keep-alive HTTP/1.1 request and return the decoded JSON response."""
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    writer.write((
+        f"{method} {path} HTTP/1.1\r\nHost: {HOST}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+    ).encode('latin-1') + body)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    length = next(int(line.split(':', 1)[1]) for line in head.decode('latin-1').split('\r\n')
+                  if line.lower().startswith('content-length:'))
+    return json.loads(await reader.readexactly(length))
+
+async def client(host, port, payloads, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for payload in payloads:
+            start = time.perf_counter()
+            await http_request(reader, writer, 'POST', '/predict', payload)
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        writer.close()
+
+async def fetch_metrics(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        return await http_request(reader, writer, 'GET', '/metrics')
+    finally:
+        writer.close()
+
+def metrics_delta(before, after):
+    """Server batching counters accumulated between two /metrics snapshots.
+    
+    /metrics is cumulative over the server's lifetime, so this isolates one
+    run. Its latency percentiles cover a rolling window and cannot be split
+    per run; the client-side percentiles stand in for them.
+    """
+    previous = before['batch_size_histogram']
+    histogram = {size: n - previous.get(size, 0) for size, n in after['batch_size_histogram'].items()}
+    histogram = {size: n for size, n in sorted(histogram.items(), key=lambda item: int(item[0])) if n}
+    batches = sum(histogram.values())
+    return {
+        'requests': after['requests'] - before['requests'],
+        'batches': batches,
+        'mean_batch_size': sum(int(size) * n for size, n in histogram.items()) / max(batches, 1),
+        'batch_size_histogram': histogram,
+    }
+
+async def run_load(host, port, concurrency, total_requests, seed=0):
+    """Drive the server with concurrency keep-alive clients and report client-side numbers."""
+    rng = np.random.default_rng(seed)
+    payloads = [{'image': base64.b64encode(rng.integers(0, 256, IMAGE_BYTES, dtype=np.uint8).tobytes()).decode()}
+                for _ in range(min(total_requests, 256))]
+    plan = [[payloads[i % len(payloads)] for i in range(c, total_requests, concurrency)]
+            for c in range(concurrency)]
+
+    latencies = []
+    before = await fetch_metrics(host, port)
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, requests, latencies) for requests in plan))
+    elapsed = time.perf_counter() - start
+    server_metrics = metrics_delta(before, await fetch_metrics(host, port))
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'requests_per_sec': len(latencies) / elapsed,
+        'client_latency_p50_ms': float(np.percentile(latencies, 50)),
+        'client_latency_p99_ms': float(np.percentile(latencies, 99)),
+        'server': server_metrics,
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Concurrent load generator for serve_model.py.")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[CONCURRENCY],
+                        help="One or more client counts to run in turn")
+    parser.add_argument('--requests', type=int, default=REQUESTS)
+    parser.add_argument('--output', default=None, help="Write the results as JSON")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    results = []
+    print(f"{'clients':>7s} {'req/s':>8s} {'p50 ms':>7s} {'p99 ms':>7s} {'mean batch':>10s}")
+    for concurrency in args.concurrency:
+        result = asyncio.run(run_load(args.host, args.port, concurrency, args.requests))
+        results.append(result)
+        print(f"{concurrency:7d} {result['requests_per_sec']:8.0f} {result['client_latency_p50_ms']:7.2f} "
+              f"{result['client_latency_p99_ms']:7.2f} {result['server']['mean_batch_size']:10.1f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,19 @@
 import os
+import time
+import argparse
 import numpy as np
 import cv2
 import json
+import hashlib
 import tensorflow as tf
+from collections import deque
+from multiprocessing import Pool
 from pathlib import Path
 from tqdm import tqdm
+from glyph_atlas import build_glyph_atlas, find_fonts, fonts_key, load_glyph_atlas
+from instrumentation import StageTrace
+from dataset_io import (DEFAULT_NUM_SHARDS, MANIFEST_NAME, VAL_FRACTION, assign_split, count_records,
+                        encode_example, read_labeled_records, shard_filename, shard_pattern, shuffle_tfrecord)
 
 # Configuration
 PROJECT_ROOT = Path(__file__).parent.parent
@@ -12,6 +21,11 @@ DATA_DIR = PROJECT_ROOT / 'data'
 PROCESSED_DIR = DATA_DIR / 'processed_data'
 IMAGES_DIR = PROCESSED_DIR / 'images'
 INPUT_SIZE = (64, 64)
+NUM_VARIATIONS = 100  # Variations rendered per character
+DEFAULT_SEED = 42
+CHUNK_SIZE = 100  # Maximum variations rendered per worker task
+GENERATOR_VERSION = 2  # Bump whenever rendering changes so cached classes are regenerated
+MANIFEST_PATH = PROCESSED_DIR / MANIFEST_NAME
 
 def ensure_directories():
     """Create necessary directories if they don't exist."""
@@ -24,19 +38,152 @@ def process_image(image):
     if len(image.shape) > 2:
         image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     
-    # Resize to target size
+    # Resize to target size; pixels stay uint8, the model rescales them
     image = cv2.resize(image, INPUT_SIZE)
     
-    # Normalize to [0, 1]
-    image = image.astype(np.float32) / 255.0
+    return image.astype(np.uint8)
+
+def render_from_atlas(glyphs, rng, augment=True):
+    """Sample one font's glyph from the atlas, downsample it and apply a random warp.
+    
+    With augment=False the first font's glyph is used centered and undistorted.
+    """
+    glyph = np.asarray(glyphs[rng.integers(len(glyphs)) if augment else 0])
+    img = cv2.resize(glyph, INPUT_SIZE, interpolation=cv2.INTER_AREA)
+    if not augment:
+        return img
+    
+    # Add some random variation
+    dx = rng.integers(-5, 6)
+    dy = rng.integers(-5, 6)
+    angle = float(rng.integers(-15, 16))
+    scale = 0.8 + rng.random() * 0.4
+    
+    M = cv2.getRotationMatrix2D((INPUT_SIZE[0]/2, INPUT_SIZE[1]/2), angle, scale)
+    M[0, 2] += dx
+    M[1, 2] += dy
+    img = cv2.warpAffine(img, M, INPUT_SIZE)
     
-    return image
+    return add_noise_and_blur(img, rng)
 
-def create_synthetic_data():
-    """Create synthetic data for testing when ETL9G dataset is not available."""
-    print("Creating synthetic dataset for testing...")
+def add_noise_and_blur(img, rng):
+    """Add Gaussian noise and, half of the time, a 3x3 blur."""
+    noise = rng.normal(0, 10, INPUT_SIZE).astype(np.uint8)
+    img = cv2.add(img, noise)
+    if rng.random() > 0.5:
+        img = cv2.GaussianBlur(img, (3, 3), 0)
+    return img
+
+def render_variation(char, rng, augment=True):
+    """Render one randomly transformed, noisy image of a character with cv2.putText.
+    
+    Fallback for when no font with kana coverage is available. With
+    augment=False the character is rendered centered and undistorted.
+    """
+    # Create a blank image
+    img = np.zeros(INPUT_SIZE, dtype=np.uint8)
+    
+    # Add the character
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    font_scale = 1.0
+    thickness = 2
+    text_size = cv2.getTextSize(char, font, font_scale, thickness)[0]
+    
+    # Center the character
+    x = (INPUT_SIZE[0] - text_size[0]) // 2
+    y = (INPUT_SIZE[1] + text_size[1]) // 2
+    
+    if not augment:
+        cv2.putText(img, char, (x, y), font, font_scale, 255, thickness)
+        return img
+    
+    # Add some random variation
+    x += rng.integers(-5, 6)
+    y += rng.integers(-5, 6)
+    angle = rng.integers(-15, 16)
+    scale = font_scale * (0.8 + rng.random() * 0.4)
+    
+    # Create transformation matrix
+    M = cv2.getRotationMatrix2D((INPUT_SIZE[0]/2, INPUT_SIZE[1]/2), float(angle), scale)
+    
+    # Put text and apply transformation
+    cv2.putText(img, char, (int(x), int(y)), font, font_scale, 255, thickness)
+    img = cv2.warpAffine(img, M, INPUT_SIZE)
+    
+    # Add noise and blur
+    return add_noise_and_blur(img, rng)
+
+def _init_worker():
+    """Keep OpenCV single-threaded inside pool workers to avoid oversubscription."""
+    cv2.setNumThreads(1)
+
+def generate_chunk(task):
+    """Render a list of variations of one character.
     
-    # Load character data from our existing characters.ts file
+    Every variation gets its own generator seeded from (seed, class index,
+    variation), so the output is identical whatever the worker count, chunk
+    size or scheduling order.
+    """
+    idx, char, variations, seed, augment, atlas_path, atlas_index = task
+    glyphs = load_glyph_atlas(atlas_path)[:, atlas_index] if atlas_path else None
+    
+    images = np.empty((len(variations), *INPUT_SIZE), dtype=np.uint8)
+    for offset, i in enumerate(variations):
+        rng = np.random.default_rng([seed, idx, i])
+        if glyphs is not None:
+            img = render_from_atlas(glyphs, rng, augment)
+        else:
+            img = render_variation(char, rng, augment)
+        
+        # Save example image
+        if i == 0:
+            cv2.imwrite(str(IMAGES_DIR / f"{char}_{i}.png"), img)
+        
+        images[offset] = process_image(img)
+    
+    return idx, variations, images
+
+def build_tasks(classes, variations_for, seed=DEFAULT_SEED, augment=True, atlas_path=None):
+    """Split the variations of every (class id, character, atlas index) in classes into chunks.
+    
+    variations_for(class id) lists the variations to render; each chunk holds
+    at most CHUNK_SIZE of them.
+    """
+    for idx, char, atlas_index in classes:
+        variations = list(variations_for(idx))
+        for start in range(0, len(variations), CHUNK_SIZE):
+            yield idx, char, variations[start:start + CHUNK_SIZE], seed, augment, atlas_path, atlas_index
+
+def iter_samples(tasks, workers=None):
+    """Yield (label, variation, image) for every task, rendered across a process pool.
+    
+    Only a bounded window of chunks is in flight, so memory stays flat no
+    matter how many variations are requested.
+    """
+    workers = workers or os.cpu_count() or 1
+    
+    def _emit(result):
+        idx, variations, images = result
+        for variation, image in zip(variations, images):
+            yield idx, variation, image
+    
+    if workers == 1:
+        for task in tasks:
+            yield from _emit(generate_chunk(task))
+        return
+    
+    with Pool(processes=workers, initializer=_init_worker) as pool:
+        # Results are consumed in submission order so the output does not depend on scheduling
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(generate_chunk, (task,)))
+            if len(pending) >= workers * 2:
+                yield from _emit(pending.popleft().get())
+        while pending:
+            yield from _emit(pending.popleft().get())
+
+def load_characters():
+    """Load the sorted, unique single kana characters from src/data/characters.ts."""
     characters_file = PROJECT_ROOT / 'src' / 'data' / 'characters.ts'
     with open(characters_file, 'r', encoding='utf-8') as f:
         content = f.read()
@@ -82,13 +229,60 @@ def create_synthetic_data():
             all_chars.append(item['character'])
     
     # Remove duplicates and sort
-    all_chars = sorted(list(set(all_chars)))
+    return sorted(list(set(all_chars)))
+
+def assign_class_ids(all_chars, previous_map, next_class_id=0):
+    """Map characters to class ids, keeping the ids of characters seen in previous builds.
+    
+    New characters get ids from next_class_id, the high-water mark that the
+    build manifest carries across builds (or after the highest id in
+    previous_map, if that is larger), so ids of removed characters are never
+    reused. Returns (class_ids, next_class_id).
+    """
+    class_ids = {char: int(idx) for idx, char in previous_map.items() if char in all_chars}
+    next_id = max(next_class_id, max((int(idx) for idx in previous_map), default=-1) + 1)
+    for char in all_chars:
+        if char not in class_ids:
+            class_ids[char] = next_id
+            next_id += 1
+    return class_ids, next_id
+
+def _hash(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def load_manifest():
+    if not MANIFEST_PATH.exists():
+        return {}
+    with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def create_synthetic_data(num_variations=NUM_VARIATIONS, seed=DEFAULT_SEED, workers=None,
+                          num_shards=DEFAULT_NUM_SHARDS, val_fraction=VAL_FRACTION, clean=False,
+                          font_paths=None, force=False, trace=None):
+    """Create synthetic data for testing when ETL9G dataset is not available.
+    
+    Only classes whose inputs changed since the last build are rendered
+    again (force=True rebuilds all of them, keeping their class ids).
+    clean=True stores one undistorted training sample per character for
+    online augmentation.
+    """
+    trace = trace or StageTrace('process_data')
+    print("Creating synthetic dataset for testing...")
     
+    with trace.stage('load_characters'):
+        all_chars = load_characters()
     print(f"Found {len(all_chars)} unique characters")
     
-    # Create character mapping
-    char_map = {i: char for i, char in enumerate(all_chars)}
-    reverse_char_map = {char: i for i, char in enumerate(all_chars)}
+    manifest = load_manifest()
+    previous_map = {}
+    if (PROCESSED_DIR / 'character_map.json').exists():
+        with open(PROCESSED_DIR / 'character_map.json', 'r', encoding='utf-8') as f:
+            previous_map = json.load(f)
+    
+    # Create character mapping, keeping class ids stable across builds
+    class_ids, next_class_id = assign_class_ids(all_chars, previous_map, manifest.get('next_class_id', 0))
+    char_map = {idx: char for char, idx in sorted(class_ids.items(), key=lambda item: item[1])}
+    reverse_char_map = {char: idx for idx, char in char_map.items()}
     
     # Save character mappings
     with open(PROCESSED_DIR / 'character_map.json', 'w', encoding='utf-8') as f:
@@ -96,107 +290,187 @@ def create_synthetic_data():
     with open(PROCESSED_DIR / 'reverse_character_map.json', 'w', encoding='utf-8') as f:
         json.dump(reverse_char_map, f, ensure_ascii=False, indent=2)
     
-    # Create synthetic images for each character
-    images = []
-    labels = []
+    # Hash everything that determines the samples of each class
+    fonts = find_fonts(font_paths)
+    params = {
+        'generator_version': GENERATOR_VERSION,
+        'variations': num_variations,
+        'seed': seed,
+        'val_fraction': val_fraction,
+        'clean': clean,
+        'fonts': fonts_key(fonts) if fonts else 'putText',
+    }
+    class_hashes = {idx: _hash({'character': char, 'class_id': idx, **params})
+                    for idx, char in char_map.items()}
     
-    for idx, char in enumerate(tqdm(all_chars, desc="Generating synthetic images")):
-        # Create multiple variations for each character
-        for i in range(100):  # 100 variations per character
-            # Create a blank image
-            img = np.zeros(INPUT_SIZE, dtype=np.uint8)
-            
-            # Add the character
-            font = cv2.FONT_HERSHEY_SIMPLEX
-            font_scale = 1.0
-            thickness = 2
-            text_size = cv2.getTextSize(char, font, font_scale, thickness)[0]
-            
-            # Center the character
-            x = (INPUT_SIZE[0] - text_size[0]) // 2
-            y = (INPUT_SIZE[1] + text_size[1]) // 2
-            
-            # Add some random variation
-            x += np.random.randint(-5, 6)
-            y += np.random.randint(-5, 6)
-            angle = np.random.randint(-15, 16)
-            scale = font_scale * (0.8 + np.random.random() * 0.4)
-            
-            # Create transformation matrix
-            M = cv2.getRotationMatrix2D((INPUT_SIZE[0]/2, INPUT_SIZE[1]/2), angle, scale)
-            
-            # Put text and apply transformation
-            cv2.putText(img, char, (x, y), font, font_scale, 255, thickness)
-            img = cv2.warpAffine(img, M, INPUT_SIZE)
-            
-            # Add noise and blur
-            noise = np.random.normal(0, 10, INPUT_SIZE).astype(np.uint8)
-            img = cv2.add(img, noise)
-            if np.random.random() > 0.5:
-                img = cv2.GaussianBlur(img, (3, 3), 0)
-            
-            # Process image
-            processed_img = process_image(img)
-            
-            # Save example image
-            if i == 0:
-                cv2.imwrite(str(IMAGES_DIR / f"{char}_{i}.png"), img)
-            
-            images.append(processed_img)
-            labels.append(idx)
-    
-    # Convert to numpy arrays
-    images = np.array(images)
-    labels = np.array(labels)
-    
-    # Split into train and validation sets
-    indices = np.random.permutation(len(images))
-    split = int(len(images) * 0.8)
-    train_indices = indices[:split]
-    val_indices = indices[split:]
-    
-    train_images = images[train_indices]
-    train_labels = labels[train_indices]
-    val_images = images[val_indices]
-    val_labels = labels[val_indices]
-    
-    # Create TFRecord files
-    def _bytes_feature(value):
-        return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
-    
-    def _int64_feature(value):
-        return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
-    
-    def create_tf_example(image, label):
-        feature = {
-            'image_raw': _bytes_feature(tf.io.serialize_tensor(image).numpy()),
-            'label': _int64_feature(label)
-        }
-        return tf.train.Example(features=tf.train.Features(feature=feature))
-    
-    # Write training data
-    with tf.io.TFRecordWriter(str(PROCESSED_DIR / 'train.tfrecord')) as writer:
-        for image, label in tqdm(zip(train_images, train_labels), desc="Writing training data"):
-            tf_example = create_tf_example(image, label)
-            writer.write(tf_example.SerializeToString())
-    
-    # Write validation data
-    with tf.io.TFRecordWriter(str(PROCESSED_DIR / 'val.tfrecord')) as writer:
-        for image, label in tqdm(zip(val_images, val_labels), desc="Writing validation data"):
-            tf_example = create_tf_example(image, label)
-            writer.write(tf_example.SerializeToString())
-    
-    print(f"Created dataset with {len(all_chars)} characters:")
-    print(f"Training samples: {len(train_images)}")
-    print(f"Validation samples: {len(val_images)}")
+    def shard_members(shard):
+        return sorted(idx for idx in char_map if idx % num_shards == shard)
+    
+    shard_names = {(split, shard): shard_filename(split, shard, num_shards)
+                   for split in ('train', 'val') for shard in range(num_shards)}
+    previous_classes = manifest.get('classes', {}) if manifest.get('num_shards') == num_shards else {}
+    previous_shards = manifest.get('shards', {})
+    if force:
+        previous_classes, previous_shards = {}, {}
+    
+    # Classes are dirty when their hash changed or their shard file went missing
+    dirty_classes = {idx for idx, digest in class_hashes.items() if previous_classes.get(str(idx)) != digest}
+    for (split, shard), name in shard_names.items():
+        if not (PROCESSED_DIR / name).exists():
+            dirty_classes.update(shard_members(shard))
+    
+    shard_hashes = {name: _hash([class_hashes[idx] for idx in shard_members(shard)])
+                    for (split, shard), name in shard_names.items()}
+    dirty_shards = {name for (split, shard), name in shard_names.items()
+                    if previous_shards.get(name) != shard_hashes[name]
+                    or dirty_classes.intersection(shard_members(shard))}
+    
+    print(f"{len(dirty_classes)} of {len(char_map)} classes and {len(dirty_shards)} of "
+          f"{len(shard_names)} shards need to be rebuilt")
+    
+    atlas_path = None
+    if dirty_classes:
+        # Rasterize every character once; all variations are sampled from this atlas
+        with trace.stage('glyph_atlas'):
+            atlas_path = build_glyph_atlas(all_chars, PROCESSED_DIR, font_paths)
+        if atlas_path is None:
+            print("WARNING: No font with kana coverage found (pass --font); "
+                  "falling back to cv2.putText, which cannot draw kana")
+    dirty = [(idx, char_map[idx], all_chars.index(char_map[idx])) for idx in sorted(dirty_classes)]
+    
+    def val_variations(idx):
+        return [i for i in range(num_variations) if assign_split(idx, i, val_fraction) == 'val']
+    
+    def split_samples():
+        if clean:
+            clean_tasks = build_tasks(dirty, lambda idx: [0], seed, False, atlas_path)
+            for label, _, image in trace.timed_iter('render', iter_samples(clean_tasks, workers)):
+                yield 'train', label, image
+            val_tasks = build_tasks(dirty, val_variations, seed, True, atlas_path)
+            for label, _, image in trace.timed_iter('render', iter_samples(val_tasks, workers)):
+                yield 'val', label, image
+        else:
+            tasks = build_tasks(dirty, lambda idx: range(num_variations), seed, True, atlas_path)
+            for label, variation, image in trace.timed_iter('render', iter_samples(tasks, workers)):
+                yield assign_split(label, variation, val_fraction), label, image
+    
+    if clean:
+        total = len(dirty) + sum(len(val_variations(idx)) for idx, _, _ in dirty)
+    else:
+        total = len(dirty) * num_variations
+    
+    # Rewrite dirty shards under temporary names: copy records of unchanged
+    # classes from the previous build, then stream in the newly rendered ones
+    start = time.perf_counter()
+    writers = {name: tf.io.TFRecordWriter(str(PROCESSED_DIR / f"{name}.partial")) for name in dirty_shards}
+    shard_records = {name: 0 for name in dirty_shards}
+    copied = 0
+    try:
+        with trace.stage('copy_unchanged'):
+            for name, writer in writers.items():
+                if (PROCESSED_DIR / name).exists():
+                    for label, record in read_labeled_records(PROCESSED_DIR / name):
+                        if label in char_map and label not in dirty_classes:
+                            writer.write(record)
+                            shard_records[name] += 1
+                            copied += 1
+        trace.count('records_copied', copied)
+        
+        for split, label, image in tqdm(split_samples(), total=total, desc="Generating synthetic images", unit="img"):
+            with trace.stage('serialize'):
+                record = encode_example(image, label)
+            with trace.stage('tfrecord_write'):
+                name = shard_filename(split, label % num_shards, num_shards)
+                writers[name].write(record)
+                shard_records[name] += 1
+            trace.count(f'{split}_records')
+            trace.count('bytes_written', len(record))
+    finally:
+        with trace.stage('tfrecord_close'):
+            for writer in writers.values():
+                writer.close()
+    
+    # Records arrive class by class; shuffle each shard so the loader's finite
+    # shuffle buffer sees all of its classes instead of a dozen at a time
+    with trace.stage('shuffle_shards'):
+        for (split, shard), name in shard_names.items():
+            if name in dirty_shards:
+                partial = PROCESSED_DIR / f"{name}.partial"
+                shuffled = PROCESSED_DIR / f"{name}.shuffled"
+                shuffle_tfrecord(partial, shuffled, [seed, shard, int(split == 'val')])
+                shuffled.replace(PROCESSED_DIR / name)
+                partial.unlink()
+    elapsed = time.perf_counter() - start
+    
+    # Unchanged shards keep their record counts; older manifests without them get them counted once
+    previous_records = manifest.get('shard_records', {})
+    for name in shard_names.values():
+        if name not in shard_records:
+            shard_records[name] = previous_records.get(name)
+            if shard_records[name] is None:
+                shard_records[name] = count_records([PROCESSED_DIR / name])
+    
+    # Remove shards left over from builds with a different shard count
+    for split in ('train', 'val'):
+        for stale in PROCESSED_DIR.glob(shard_pattern(split)):
+            if stale.name not in shard_hashes:
+                stale.unlink()
+    
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump({
+            'num_shards': num_shards,
+            # Every class lives in a single shard, so shards must not be split between workers
+            'class_partitioned': True,
+            'next_class_id': next_class_id,
+            'params': params,
+            'classes': {str(idx): digest for idx, digest in class_hashes.items()},
+            'shards': shard_hashes,
+            'shard_records': shard_records,
+            'records': {split: sum(shard_records[shard_names[(split, shard)]] for shard in range(num_shards))
+                        for split in ('train', 'val')},
+        }, f, ensure_ascii=False, indent=2)
+    
+    print(f"Generated {total} images in {elapsed:.1f}s "
+          f"({total / max(elapsed, 1e-9):.0f} images/sec, {workers or os.cpu_count()} workers)")
+    print(f"Copied {copied} unchanged records from the previous build")
+    print(f"Created dataset with {len(all_chars)} characters in {num_shards} shards per split")
     return True
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate the synthetic kana dataset.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes for image generation (default: all CPUs, 1 = serial)")
+    parser.add_argument('--variations', type=int, default=NUM_VARIATIONS,
+                        help="Variations rendered per character")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED,
+                        help="Seed for reproducible generation")
+    parser.add_argument('--shards', type=int, default=DEFAULT_NUM_SHARDS,
+                        help="Number of TFRecord shards per split")
+    parser.add_argument('--val-fraction', type=float, default=VAL_FRACTION,
+                        help="Fraction of samples assigned to the validation split")
+    parser.add_argument('--clean', action='store_true',
+                        help="Store one undistorted training sample per character for online augmentation")
+    parser.add_argument('--font', dest='fonts', action='append', default=None,
+                        help="Font file with kana coverage for the glyph atlas (repeatable; "
+                             "default: common system CJK fonts)")
+    parser.add_argument('--force', action='store_true',
+                        help="Regenerate every class, ignoring the build manifest's hashes (class ids are kept)")
+    parser.add_argument('--trace', default=None,
+                        help="Write per-stage timings and counters to this .json or .csv file")
+    return parser.parse_args()
+
 def main():
     """Main processing function."""
+    args = parse_args()
     ensure_directories()
     
     # For now, we'll use synthetic data since we don't have the ETL9G dataset
-    success = create_synthetic_data()
+    trace = StageTrace('process_data')
+    success = create_synthetic_data(args.variations, args.seed, args.workers,
+                                    args.shards, args.val_fraction, args.clean, args.fonts, args.force, trace)
+    trace.report()
+    if args.trace:
+        trace.write(args.trace)
     
     if success:
         print("Data processing completed successfully!")
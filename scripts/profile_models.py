@@ -0,0 +1,115 @@
+import json
+import time
+import argparse
+import itertools
+import numpy as np
+import tensorflow as tf
+from pathlib import Path
+from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+
+from dataset_io import class_count
+from train_model import ARCHITECTURES, PROCESSED_DIR, RUNS_DIR, create_model, load_data
+
+LATENCY_RUNS = 100
+DEFAULT_WIDTHS = (0.5, 1.0)
+DEFAULT_DEPTHS = (1, 2)
+
+def count_flops(model):
+    """Floating point operations of one single-sample forward pass."""
+    forward = tf.function(lambda x: model(x, training=False))
+    concrete = forward.get_concrete_function(tf.TensorSpec([1, *model.input_shape[1:]], tf.float32))
+    frozen = convert_variables_to_constants_v2(concrete)
+    options = tf.compat.v1.profiler.ProfileOptionBuilder.float_operation()
+    options['output'] = 'none'
+    info = tf.compat.v1.profiler.profile(graph=frozen.graph, run_meta=tf.compat.v1.RunMetadata(),
+                                         cmd='op', options=options)
+    return info.total_float_ops
+
+def measure_latency(model, runs=LATENCY_RUNS):
+    """Median and p95 single-sample CPU latency in milliseconds."""
+    forward = tf.function(lambda x: model(x, training=False))
+    image = tf.constant(np.random.default_rng(0).integers(0, 256, (1, *model.input_shape[1:])), tf.float32)
+    with tf.device('/CPU:0'):
+        forward(image)  # trace once
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            forward(image).numpy()
+            timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings)), float(np.percentile(timings, 95))
+
+def profile_variant(num_classes, architecture, width, depth, train_epochs=0, datasets=None):
+    """Parameters, FLOPs, CPU latency and (optionally) validation accuracy of one variant."""
+    model = create_model(num_classes, architecture, width, depth)
+    p50, p95 = measure_latency(model)
+    result = {
+        'architecture': architecture,
+        'width': width,
+        'depth': depth,
+        'params': int(model.count_params()),
+        'flops': int(count_flops(model)),
+        'latency_p50_ms': p50,
+        'latency_p95_ms': p95,
+    }
+    if train_epochs and datasets:
+        model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+        train_dataset, val_dataset = datasets
+        history = model.fit(train_dataset, validation_data=val_dataset, epochs=train_epochs, verbose=0)
+        result['val_accuracy'] = float(max(history.history['val_accuracy']))
+    return result
+
+def pick_variant(results, latency_budget_ms):
+    """Most accurate variant within the latency budget; without accuracies, the largest one that fits."""
+    fitting = [r for r in results if r['latency_p95_ms'] <= latency_budget_ms]
+    if not fitting:
+        return None
+    if all('val_accuracy' in r for r in fitting):
+        return max(fitting, key=lambda r: r['val_accuracy'])
+    return max(fitting, key=lambda r: r['params'])
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Profile model variants for parameters, FLOPs and CPU latency.")
+    parser.add_argument('--architectures', nargs='+', choices=ARCHITECTURES, default=list(ARCHITECTURES))
+    parser.add_argument('--widths', nargs='+', type=float, default=list(DEFAULT_WIDTHS))
+    parser.add_argument('--depths', nargs='+', type=int, default=list(DEFAULT_DEPTHS))
+    parser.add_argument('--latency-budget-ms', type=float, default=None,
+                        help="Per-stroke p95 latency budget used to pick a variant")
+    parser.add_argument('--train-epochs', type=int, default=0,
+                        help="Briefly train each variant to report validation accuracy (0 = skip)")
+    parser.add_argument('--output', default=str(RUNS_DIR / 'model_profile.json'))
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    with open(PROCESSED_DIR / 'character_map.json', 'r', encoding='utf-8') as f:
+        num_classes = class_count(json.load(f))
+
+    datasets = load_data() if args.train_epochs else None
+    results = []
+    print(f"{'architecture':12s} {'width':>5s} {'depth':>5s} {'params':>10s} {'MFLOPs':>8s} "
+          f"{'p50 ms':>7s} {'p95 ms':>7s} {'val_acc':>8s}")
+    for architecture, width, depth in itertools.product(args.architectures, args.widths, args.depths):
+        result = profile_variant(num_classes, architecture, width, depth, args.train_epochs, datasets)
+        results.append(result)
+        accuracy = f"{result['val_accuracy']:8.4f}" if 'val_accuracy' in result else f"{'-':>8s}"
+        print(f"{architecture:12s} {width:5.2f} {depth:5d} {result['params']:10d} {result['flops'] / 1e6:8.1f} "
+              f"{result['latency_p50_ms']:7.2f} {result['latency_p95_ms']:7.2f} {accuracy}")
+
+    report = {'variants': results}
+    if args.latency_budget_ms is not None:
+        choice = pick_variant(results, args.latency_budget_ms)
+        report['latency_budget_ms'] = args.latency_budget_ms
+        report['selected'] = choice
+        if choice:
+            print(f"Selected {choice['architecture']} width={choice['width']} depth={choice['depth']} "
+                  f"for a {args.latency_budget_ms} ms budget")
+        else:
+            print(f"No variant fits a {args.latency_budget_ms} ms budget")
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Profile written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+import json
+import time
+import base64
+import asyncio
+import argparse
+import collections
+import numpy as np
+from pathlib import Path
+from dataset_io import IMAGE_BYTES, IMAGE_SHAPE
+from evaluate import MODEL_DIR, load_model
+
+HOST = '127.0.0.1'
+PORT = 8500
+MAX_BATCH_SIZE = 64
+MAX_WAIT_MS = 5.0
+TOP_K = 5
+METRICS_WINDOW = 10000  # latest requests kept for the latency percentiles
+MAX_BODY_BYTES = 1024 * 1024
+
+class MicroBatcher:
+    """Collect concurrent requests into one predict call.
+
+    A batch is flushed when it reaches max_batch_size or when its oldest
+    request has waited max_wait_ms, whichever comes first. Prediction runs in
+    a worker thread so the event loop keeps accepting requests meanwhile.
+    """
+
+    def __init__(self, model, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.latencies_ms = collections.deque(maxlen=METRICS_WINDOW)
+        self.batch_sizes = collections.Counter()
+        self.requests = 0
+
+    async def predict(self, image):
+        """Queue one uint8 image and wait for its probability vector."""
+        future = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        await self.queue.put((image, future))
+        probabilities = await future
+        self.latencies_ms.append((time.perf_counter() - start) * 1000)
+        self.requests += 1
+        return probabilities
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            images = np.stack([image for image, _ in batch]).astype(np.float32)
+            self.batch_sizes[len(batch)] += 1
+            try:
+                probabilities = await loop.run_in_executor(None, self._predict, images)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), row in zip(batch, probabilities):
+                if not future.done():
+                    future.set_result(row)
+
+    def _predict(self, images):
+        return self.model.predict_on_batch(images)
+
+    def metrics(self):
+        latencies = np.array(self.latencies_ms) if self.latencies_ms else np.zeros(1)
+        batches = sum(self.batch_sizes.values())
+        return {
+            'requests': self.requests,
+            'batches': batches,
+            'mean_batch_size': sum(size * n for size, n in self.batch_sizes.items()) / max(batches, 1),
+            'batch_size_histogram': {str(size): n for size, n in sorted(self.batch_sizes.items())},
+            'latency_p50_ms': float(np.percentile(latencies, 50)),
+            'latency_p99_ms': float(np.percentile(latencies, 99)),
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+        }
+
+def decode_image(payload):
+    """64x64 grayscale raster from {"image": base64 uint8 bytes} or {"pixels": [[...]]} (0-255)."""
+    if 'image' in payload:
+        image = np.frombuffer(base64.b64decode(payload['image']), dtype=np.uint8)
+    else:
+        image = np.asarray(payload['pixels'], dtype=np.float32).clip(0, 255).astype(np.uint8)
+    if image.size != IMAGE_BYTES:
+        raise ValueError(f"Expected a 64x64 raster ({IMAGE_BYTES} values), got {image.size}")
+    return image.reshape(IMAGE_SHAPE)
+
+def top_predictions(probabilities, character_map, top_k=TOP_K):
+    ranked = np.argsort(-probabilities)[:top_k]
+    return [{'character': character_map.get(str(idx), ''), 'confidence': float(probabilities[idx])}
+            for idx in ranked]
+
+async def read_request(reader):
+    """Minimal HTTP/1.1 request parser; returns (method, path, headers, body) or None on EOF."""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        return None
+    lines = head.decode('latin-1').split('\r\n')
+    method, path, _ = lines[0].split(' ', 2)
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY_BYTES:
+        raise ValueError("Request body too large")
+    try:
+        body = await reader.readexactly(length) if length else b''
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    return method, path, headers, body
+
+def write_response(writer, status, payload, keep_alive):
+    # A 204 must not carry a body, or keep-alive clients read it as the next response
+    body = b'' if status == 204 else json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    reason = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found'}.get(status, 'Error')
+    writer.write((
+        f"HTTP/1.1 {status} {reason}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Access-Control-Allow-Origin: *\r\n"
+        "Access-Control-Allow-Headers: Content-Type\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    ).encode('latin-1') + body)
+
+def make_handler(batcher, character_map):
+    async def handle(reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except ValueError as e:
+                    write_response(writer, 400, {'error': str(e)}, False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+
+                if method == 'OPTIONS':
+                    write_response(writer, 204, None, keep_alive)
+                elif method == 'GET' and path == '/metrics':
+                    write_response(writer, 200, batcher.metrics(), keep_alive)
+                elif method == 'POST' and path == '/predict':
+                    try:
+                        image = decode_image(json.loads(body))
+                    except (ValueError, KeyError, TypeError) as e:
+                        write_response(writer, 400, {'error': str(e)}, keep_alive)
+                    else:
+                        probabilities = await batcher.predict(image)
+                        write_response(writer, 200, {'predictions': top_predictions(probabilities, character_map)},
+                                       keep_alive)
+                else:
+                    write_response(writer, 404, {'error': f"No route for {method} {path}"}, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    return handle
+
+async def serve(model_path, character_map_path, host=HOST, port=PORT,
+                max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+    with open(character_map_path, 'r', encoding='utf-8') as f:
+        character_map = json.load(f)
+    model = load_model(model_path)
+    # Trace the predict function before taking traffic
+    model.predict_on_batch(np.zeros((1, *IMAGE_SHAPE), dtype=np.float32))
+
+    batcher = MicroBatcher(model, max_batch_size, max_wait_ms)
+    batch_task = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(make_handler(batcher, character_map), host, port)
+    print(f"Serving {Path(model_path).name} on http://{host}:{port} "
+          f"(max batch {max_batch_size}, max wait {max_wait_ms} ms)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the character model over HTTP with dynamic micro-batching.")
+    parser.add_argument('--model', default=str(MODEL_DIR / 'best_model.h5'),
+                        help="Keras model file or exported TF.js model directory/model.json")
+    parser.add_argument('--character-map', default=str(MODEL_DIR / 'character_map.json'))
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS,
+                        help="Longest a request waits for others to join its batch")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    try:
+        asyncio.run(serve(args.model, args.character_map, args.host, args.port,
+                          args.max_batch_size, args.max_wait_ms))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,224 @@
+import json
+import argparse
+import numpy as np
+import cv2
+from pathlib import Path
+from tqdm import tqdm
+from glyph_atlas import build_glyph_atlas, load_glyph_atlas
+from dataset_io import VAL_FRACTION, assign_split
+from process_data import DEFAULT_SEED, NUM_VARIATIONS, PROCESSED_DIR, load_characters, render_variation
+
+# Stroke sequences: SEQUENCE_LENGTH points of (dx, dy, pen_up), stored as float16
+SEQUENCE_LENGTH = 64
+STROKE_FEATURES = 3
+STROKE_SHAPE = (SEQUENCE_LENGTH, STROKE_FEATURES)
+STROKE_DIR = PROCESSED_DIR / 'strokes'
+
+TRACE_SIZE = 64  # Glyphs are skeletonized at this resolution
+MAX_GAP = 2  # Pixels the pen may jump within one stroke
+MIN_STROKE_POINTS = 3  # Shorter traces are skeleton noise
+START_BAND = 8  # Rows grouped together when picking where the next stroke starts
+
+# Writer variation applied to the traced points
+MAX_ROTATION_DEGREES = 15
+SCALE_RANGE = (0.8, 1.2)
+MAX_SHEAR = 0.2
+MAX_SHIFT = 0.05
+JITTER_PIXELS = 0.5
+
+def skeletonize(mask):
+    """Morphological skeleton of a binary (0/255) uint8 mask."""
+    element = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+    skeleton = np.zeros_like(mask)
+    while cv2.countNonZero(mask):
+        opened = cv2.morphologyEx(mask, cv2.MORPH_OPEN, element)
+        skeleton |= cv2.subtract(mask, opened)
+        mask = cv2.erode(mask, element)
+    return skeleton
+
+def trace_strokes(skeleton, max_gap=MAX_GAP):
+    """Order skeleton pixels into simulated pen strokes with a greedy nearest-neighbour walk.
+
+    Each stroke starts at the highest remaining pixel band, preferring
+    skeleton endpoints and then the leftmost pixel (top-to-bottom,
+    left-to-right, as kana are usually written). The pen lifts when the
+    nearest unvisited pixel is more than max_gap pixels away. Returns a list
+    of (n, 2) float32 arrays of (x, y) pixel coordinates.
+    """
+    ys, xs = np.nonzero(skeleton)
+    if len(xs) == 0:
+        return []
+    points = np.stack([xs, ys], axis=1).astype(np.float32)
+    neighbours = cv2.filter2D((skeleton > 0).astype(np.uint8), -1, np.ones((3, 3), np.float32),
+                              borderType=cv2.BORDER_CONSTANT)[ys, xs]
+    not_endpoint = neighbours != 2  # an endpoint counts itself and one neighbour
+
+    visited = np.zeros(len(points), dtype=bool)
+    strokes = []
+    while not visited.all():
+        candidates = np.flatnonzero(~visited)
+        order = np.lexsort((points[candidates, 0], not_endpoint[candidates], points[candidates, 1] // START_BAND))
+        current = candidates[order[0]]
+        visited[current] = True
+        stroke = [current]
+        while True:
+            remaining = np.flatnonzero(~visited)
+            if len(remaining) == 0:
+                break
+            distances = np.abs(points[remaining] - points[current]).max(axis=1)
+            nearest = np.argmin(distances)
+            if distances[nearest] > max_gap:
+                break
+            current = remaining[nearest]
+            visited[current] = True
+            stroke.append(current)
+        if len(stroke) >= MIN_STROKE_POINTS:
+            strokes.append(points[stroke])
+    return strokes
+
+def glyph_strokes(glyph):
+    """Simulated strokes of one white-on-black glyph, in TRACE_SIZE pixel coordinates."""
+    glyph = cv2.resize(np.asarray(glyph), (TRACE_SIZE, TRACE_SIZE), interpolation=cv2.INTER_AREA)
+    _, mask = cv2.threshold(glyph, 127, 255, cv2.THRESH_BINARY)
+    return trace_strokes(skeletonize(mask))
+
+def augment_strokes(strokes, rng):
+    """Apply one random rotation, scale, shear and shift around the center, plus per-point jitter."""
+    angle = np.deg2rad(rng.uniform(-MAX_ROTATION_DEGREES, MAX_ROTATION_DEGREES))
+    scale = rng.uniform(*SCALE_RANGE)
+    shear = rng.uniform(-MAX_SHEAR, MAX_SHEAR)
+    cos, sin = np.cos(angle), np.sin(angle)
+    matrix = scale * np.array([[cos, -sin], [sin, cos]]) @ np.array([[1, shear], [0, 1]])
+    center = TRACE_SIZE / 2
+    shift = rng.uniform(-MAX_SHIFT, MAX_SHIFT, 2) * TRACE_SIZE
+    return [((s - center) @ matrix.T + center + shift + rng.normal(0, JITTER_PIXELS, s.shape)).astype(np.float32)
+            for s in strokes]
+
+def resample_strokes(strokes, length=SEQUENCE_LENGTH):
+    """Resample strokes to length points spaced evenly along the pen path.
+
+    Points are shared out between strokes by their length, with at least two
+    (start and end) per stroke. Returns (length, 3) rows of (x, y, pen_up)
+    where pen_up is 1 on the last point of every stroke.
+    """
+    sequence = np.zeros((length, STROKE_FEATURES), dtype=np.float32)
+    # Keep the longest strokes when there are too many to give each two points
+    if len(strokes) > length // 2:
+        keep = sorted(sorted(range(len(strokes)), key=lambda i: -len(strokes[i]))[:length // 2])
+        strokes = [strokes[i] for i in keep]
+    if not strokes:
+        return sequence
+
+    distances = [np.concatenate([[0], np.cumsum(np.linalg.norm(np.diff(s, axis=0), axis=1))]) for s in strokes]
+    lengths = np.array([max(d[-1], 1e-6) for d in distances])
+    counts = np.maximum(2, np.round(lengths / lengths.sum() * length)).astype(int)
+    while counts.sum() > length:
+        counts[np.argmax(np.where(counts > 2, counts, 0))] -= 1
+    while counts.sum() < length:
+        counts[np.argmax(lengths / counts)] += 1
+
+    row = 0
+    for stroke, distance, count in zip(strokes, distances, counts):
+        targets = np.linspace(0, distance[-1], count)
+        sequence[row:row + count, 0] = np.interp(targets, distance, stroke[:, 0])
+        sequence[row:row + count, 1] = np.interp(targets, distance, stroke[:, 1])
+        sequence[row + count - 1, 2] = 1
+        row += count
+    return sequence
+
+def to_deltas(sequence):
+    """Turn absolute pixel points into (dx, dy, pen_up) offsets normalized to the glyph size."""
+    deltas = sequence.copy()
+    xy = sequence[:, :2] / TRACE_SIZE
+    deltas[:, :2] = np.diff(xy, axis=0, prepend=np.zeros((1, 2), dtype=np.float32))
+    return deltas
+
+def stroke_sequence(strokes, rng, augment=True):
+    """One (dx, dy, pen_up) sequence from traced strokes, randomly varied when augment is set."""
+    if augment:
+        strokes = augment_strokes(strokes, rng)
+    return to_deltas(resample_strokes(strokes))
+
+def stroke_paths(split, data_dir=STROKE_DIR):
+    data_dir = Path(data_dir)
+    return data_dir / f"{split}_sequences.npy", data_dir / f"{split}_labels.npy"
+
+def load_stroke_split(split, data_dir=STROKE_DIR):
+    """Memory-map one split as (float16 (count, SEQUENCE_LENGTH, 3) sequences, int32 labels)."""
+    sequences_path, labels_path = stroke_paths(split, data_dir)
+    if not sequences_path.exists():
+        raise FileNotFoundError(f"No stroke sequences in {data_dir}; run stroke_data.py first")
+    return np.load(sequences_path, mmap_mode='r'), np.load(labels_path, mmap_mode='r')
+
+def create_stroke_dataset(num_variations=NUM_VARIATIONS, seed=DEFAULT_SEED, val_fraction=VAL_FRACTION,
+                          font_paths=None, output_dir=STROKE_DIR):
+    """Generate simulated stroke sequences for every character of the current character map.
+
+    Every (font, character) glyph of the atlas is traced once; variations
+    only transform the traced points, with a generator seeded from (seed,
+    class id, variation). Samples use the same hashed train/val assignment
+    and class ids as the raster dataset and are written straight into
+    memory-mapped .npy arrays.
+    """
+    map_path = PROCESSED_DIR / 'character_map.json'
+    if not map_path.exists():
+        raise FileNotFoundError(f"No character map in {PROCESSED_DIR}; run process_data.py first")
+    with open(map_path, 'r', encoding='utf-8') as f:
+        char_map = {int(idx): char for idx, char in json.load(f).items()}
+
+    all_chars = load_characters()
+    classes = [(idx, char) for idx, char in sorted(char_map.items()) if char in all_chars]
+    atlas_path = build_glyph_atlas(all_chars, PROCESSED_DIR, font_paths)
+    if atlas_path is None:
+        print("WARNING: No font with kana coverage found (pass --font); "
+              "falling back to cv2.putText, which cannot draw kana")
+
+    splits = {(idx, i): assign_split(idx, i, val_fraction) for idx, _ in classes for i in range(num_variations)}
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    arrays = {}
+    for split in ('train', 'val'):
+        count = sum(1 for s in splits.values() if s == split)
+        sequences_path, labels_path = stroke_paths(split, output_dir)
+        arrays[split] = (np.lib.format.open_memmap(sequences_path, mode='w+', dtype=np.float16,
+                                                   shape=(count, *STROKE_SHAPE)),
+                         np.lib.format.open_memmap(labels_path, mode='w+', dtype=np.int32, shape=(count,)))
+
+    rows = {'train': 0, 'val': 0}
+    for idx, char in tqdm(classes, desc="Tracing stroke sequences", unit="char"):
+        if atlas_path:
+            glyphs = load_glyph_atlas(atlas_path)[:, all_chars.index(char)]
+        else:
+            glyphs = [render_variation(char, np.random.default_rng(0), augment=False)]
+        traced = [glyph_strokes(glyph) for glyph in glyphs]
+        for i in range(num_variations):
+            rng = np.random.default_rng([seed, idx, i])
+            split = splits[(idx, i)]
+            sequences, labels = arrays[split]
+            sequences[rows[split]] = stroke_sequence(traced[rng.integers(len(traced))], rng)
+            labels[rows[split]] = idx
+            rows[split] += 1
+
+    for sequences, labels in arrays.values():
+        sequences.flush()
+        labels.flush()
+    raster_bytes = TRACE_SIZE * TRACE_SIZE
+    sample_bytes = SEQUENCE_LENGTH * STROKE_FEATURES * np.dtype(np.float16).itemsize
+    print(f"Wrote {rows['train']} train and {rows['val']} val stroke sequences to {output_dir} "
+          f"({sample_bytes} bytes per sample vs {raster_bytes} for a raster)")
+    return rows
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate simulated stroke-sequence data from the glyph atlas.")
+    parser.add_argument('--variations', type=int, default=NUM_VARIATIONS,
+                        help="Variations generated per character")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--val-fraction', type=float, default=VAL_FRACTION)
+    parser.add_argument('--font', dest='fonts', action='append', default=None,
+                        help="Font file with kana coverage for the glyph atlas (repeatable)")
+    parser.add_argument('--output-dir', default=str(STROKE_DIR))
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    create_stroke_dataset(args.variations, args.seed, args.val_fraction, args.fonts, args.output_dir)
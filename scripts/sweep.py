@@ -0,0 +1,202 @@
+import os
+import csv
+import sys
+import json
+import math
+import random
+import argparse
+import itertools
+import multiprocessing
+from pathlib import Path
+from launch_local_cluster import cap_threads
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SWEEP_DIR = PROJECT_ROOT / 'data' / 'sweeps'
+
+# Default search space
+LEARNING_RATES = (1e-3, 3e-4)
+BATCH_SIZES = (32, 64)
+WIDTHS = (0.5, 1.0)
+DEPTHS = (1, 2)
+
+# Successive halving: every rung trains the survivors up to the next epoch
+# budget, then keeps the best 1/ETA of them
+MIN_EPOCHS = 1
+MAX_EPOCHS = 9
+ETA = 3
+SEED = 42
+
+RESULT_FIELDS = ['trial', 'rung', 'epochs', 'learning_rate', 'batch_size', 'architecture', 'width', 'depth',
+                 'val_accuracy', 'examples_per_sec', 'train_seconds', 'params', 'latency_p50_ms', 'status']
+
+def rung_epochs(min_epochs=MIN_EPOCHS, max_epochs=MAX_EPOCHS, eta=ETA):
+    """Epoch budgets of the rungs, growing by eta up to max_epochs (e.g. 1, 3, 9)."""
+    budgets = []
+    budget = min_epochs
+    while budget < max_epochs:
+        budgets.append(budget)
+        budget *= eta
+    budgets.append(max_epochs)
+    return budgets
+
+def search_space(learning_rates, batch_sizes, architectures, widths, depths, trials=None, seed=SEED):
+    """Trial configs over the full grid, or a seeded random sample of trials of them."""
+    grid = [{'learning_rate': lr, 'batch_size': bs, 'architecture': arch, 'width': w, 'depth': d}
+            for lr, bs, arch, w, d in itertools.product(learning_rates, batch_sizes, architectures, widths, depths)]
+    if trials and trials < len(grid):
+        grid = random.Random(seed).sample(grid, trials)
+    return [{'trial': i, **config} for i, config in enumerate(grid)]
+
+def _init_trial_worker(threads):
+    """Cap the threads of every trial process before TensorFlow is imported in it."""
+    cap_threads(os.environ, threads)
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+def run_trial(task):
+    """Train one trial from its previous rung's checkpoint up to the rung's epoch budget.
+
+    Runs in a pool process; TensorFlow is only imported here so the thread
+    caps set by the pool initializer apply. The model, with its optimizer
+    state, is saved after every rung so the next rung continues training
+    instead of starting over.
+    """
+    config, start_epoch, end_epoch, output_dir, seed = task
+    import tensorflow as tf
+    from dataset_io import class_count
+    from profile_models import measure_latency
+    from train_model import PROCESSED_DIR, ThroughputCallback, create_model, load_data, train_examples
+
+    result = {**config, 'epochs': end_epoch}
+    checkpoint = Path(output_dir) / f"trial_{config['trial']:03d}.h5"
+    try:
+        tf.keras.backend.clear_session()
+        tf.keras.utils.set_random_seed(seed)
+        if start_epoch:
+            model = tf.keras.models.load_model(checkpoint)
+        else:
+            with open(PROCESSED_DIR / 'character_map.json', 'r', encoding='utf-8') as f:
+                num_classes = class_count(json.load(f))
+            model = create_model(num_classes, config['architecture'], config['width'], config['depth'])
+            model.compile(optimizer=tf.keras.optimizers.Adam(config['learning_rate']),
+                          loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+
+        train_dataset, val_dataset = load_data(config['batch_size'], seed=seed)
+        throughput = ThroughputCallback(config['batch_size'], train_examples())
+        history = model.fit(train_dataset, validation_data=val_dataset, initial_epoch=start_epoch,
+                            epochs=end_epoch, callbacks=[throughput], verbose=0)
+        model.save(checkpoint)
+
+        result.update({
+            'val_accuracy': float(history.history['val_accuracy'][-1]),
+            'examples_per_sec': sum(throughput.examples_per_sec) / len(throughput.examples_per_sec),
+            'train_seconds': sum(throughput.epoch_times),
+            'params': int(model.count_params()),
+            'latency_p50_ms': measure_latency(model)[0],
+        })
+    except Exception as e:
+        result['status'] = f"error: {e}"
+    return result
+
+class ResultsTable:
+    """Append one row per trial and rung to a CSV file as results come in."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w', newline='', encoding='utf-8') as f:
+            csv.DictWriter(f, RESULT_FIELDS).writeheader()
+
+    def append(self, row):
+        with open(self.path, 'a', newline='', encoding='utf-8') as f:
+            csv.DictWriter(f, RESULT_FIELDS, extrasaction='ignore').writerow(row)
+
+def successive_halving(trials, budgets, parallel, threads, output_dir, eta=ETA, seed=SEED):
+    """Run every trial through the rungs in a process pool, pruning all but the best 1/eta after each rung.
+
+    Returns the last result of every trial, with the rung it reached.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    table = ResultsTable(output_dir / 'results.csv')
+    final = {}
+    survivors = trials
+    previous = 0
+    # TensorFlow is not fork-safe, so trial processes are spawned fresh
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes=parallel, initializer=_init_trial_worker, initargs=(threads,)) as pool:
+        for rung, budget in enumerate(budgets):
+            print(f"Rung {rung}: training {len(survivors)} trial(s) to {budget} epoch(s)")
+            tasks = [(config, previous, budget, output_dir, seed) for config in survivors]
+            results = []
+            for result in pool.imap_unordered(run_trial, tasks):
+                result['rung'] = rung
+                results.append(result)
+                final[result['trial']] = result
+                status = result.get('status') or f"val_accuracy {result['val_accuracy']:.4f}"
+                print(f"  trial {result['trial']:3d} lr={result['learning_rate']:g} bs={result['batch_size']} "
+                      f"{result['architecture']} w={result['width']} d={result['depth']}: {status}")
+
+            ranked = sorted((r for r in results if 'status' not in r), key=lambda r: -r['val_accuracy'])
+            last_rung = rung == len(budgets) - 1
+            keep = len(ranked) if last_rung else max(1, math.floor(len(ranked) / eta))
+            for position, result in enumerate(ranked):
+                result['status'] = 'final' if last_rung else ('kept' if position < keep else 'pruned')
+            for result in sorted(results, key=lambda r: r['trial']):
+                table.append(result)
+
+            survivors = [{key: r[key] for key in ('trial', 'learning_rate', 'batch_size', 'architecture',
+                                                  'width', 'depth')} for r in ranked[:keep]]
+            previous = budget
+            if not survivors:
+                break
+    print(f"Results table written to {table.path}")
+    return list(final.values())
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Hyperparameter sweep with parallel trials and successive-halving pruning on val_accuracy.")
+    parser.add_argument('--learning-rates', nargs='+', type=float, default=list(LEARNING_RATES))
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=list(BATCH_SIZES))
+    parser.add_argument('--architectures', nargs='+', default=['cnn'],
+                        help="Model families to search (see train_model.create_model)")
+    parser.add_argument('--widths', nargs='+', type=float, default=list(WIDTHS))
+    parser.add_argument('--depths', nargs='+', type=int, default=list(DEPTHS))
+    parser.add_argument('--trials', type=int, default=None,
+                        help="Randomly sample this many configurations instead of the full grid")
+    parser.add_argument('--min-epochs', type=int, default=MIN_EPOCHS, help="Epoch budget of the first rung")
+    parser.add_argument('--max-epochs', type=int, default=MAX_EPOCHS, help="Epoch budget of the last rung")
+    parser.add_argument('--eta', type=int, default=ETA, help="Keep the best 1/eta trials after each rung")
+    parser.add_argument('--parallel', type=int, default=2, help="Trials trained at the same time")
+    parser.add_argument('--threads-per-trial', type=int, default=None,
+                        help="Cap TensorFlow/OpenMP threads in each trial (default: cpus / parallel)")
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--output-dir', default=str(SWEEP_DIR), help="Trial checkpoints and results table")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    threads = args.threads_per_trial or max(1, (os.cpu_count() or 1) // args.parallel)
+    trials = search_space(args.learning_rates, args.batch_sizes, args.architectures, args.widths, args.depths,
+                          args.trials, args.seed)
+    budgets = rung_epochs(args.min_epochs, args.max_epochs, args.eta)
+    print(f"Sweeping {len(trials)} trial(s) over rungs of {budgets} epochs, "
+          f"{args.parallel} at a time with {threads} thread(s) each")
+
+    results = successive_halving(trials, budgets, args.parallel, threads, args.output_dir, args.eta, args.seed)
+    finished = sorted((r for r in results if r.get('status') == 'final'), key=lambda r: -r['val_accuracy'])
+    if not finished:
+        print("No trial finished")
+        return 1
+
+    print(f"{'trial':>5s} {'lr':>8s} {'batch':>5s} {'architecture':12s} {'width':>5s} {'depth':>5s} "
+          f"{'val_acc':>8s} {'ex/s':>7s} {'params':>9s} {'p50 ms':>7s}")
+    for r in finished:
+        print(f"{r['trial']:5d} {r['learning_rate']:8.1e} {r['batch_size']:5d} {r['architecture']:12s} "
+              f"{r['width']:5.2f} {r['depth']:5d} {r['val_accuracy']:8.4f} {r['examples_per_sec']:7.0f} "
+              f"{r['params']:9d} {r['latency_p50_ms']:7.2f}")
+    with open(Path(args.output_dir) / 'best.json', 'w', encoding='utf-8') as f:
+        json.dump(finished[0], f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import math
+import importlib.util
+from pathlib import Path
+import pytest
+
+np = pytest.importorskip('numpy')
+tf = pytest.importorskip('tensorflow')
+
+from dataset_io import (IMAGE_SHAPE, RECORD_FORMAT_VERSION, PackedSampleStore, class_count, encode_example,
+                        open_sample_store, parse_batch, shuffle_tfrecord, stratified_split)
+
+ETL9G_SCRIPT = Path(__file__).parent.parent / 'data' / 'test.py'
+
+@pytest.mark.parametrize('val_fraction', [0.1, 0.2, 0.25, 1 / 3])
+@pytest.mark.parametrize('key', ['あ', 'ア', 'ん', 12])
+def test_stratified_split_keeps_every_prefix_within_floor_and_ceil(key, val_fraction):
+    val = 0
+    for n in range(1, 301):
+        val += stratified_split(key, n - 1, val_fraction) == 'val'
+        assert math.floor(n * val_fraction) <= val <= math.ceil(n * val_fraction)
+
+def test_stratified_split_is_deterministic():
+    first = [stratified_split('か', i) for i in range(50)]
+    assert first == [stratified_split('か', i) for i in range(50)]
+
+def test_class_count_covers_gaps_left_by_removed_classes():
+    assert class_count({'0': 'あ', '1': 'い', '5': 'か'}) == 6
+
+def read_records(path):
+    return list(tf.data.TFRecordDataset(str(path)).as_numpy_iterator())
+
+def test_shuffle_tfrecord_permutes_every_record_across_buckets(tmp_path):
+    records = [f"record {i:04d}".encode('utf-8') for i in range(500)]
+    with tf.io.TFRecordWriter(str(tmp_path / 'src.tfrecord')) as writer:
+        for record in records:
+            writer.write(record)
+    # A tiny bucket size forces the multi-bucket path
+    shuffle_tfrecord(tmp_path / 'src.tfrecord', tmp_path / 'a.tfrecord', 7, bucket_bytes=1024)
+    shuffle_tfrecord(tmp_path / 'src.tfrecord', tmp_path / 'b.tfrecord', 7, bucket_bytes=1024)
+
+    shuffled = read_records(tmp_path / 'a.tfrecord')
+    assert sorted(shuffled) == records
+    assert shuffled != records
+    assert shuffled == read_records(tmp_path / 'b.tfrecord')
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['a.tfrecord', 'b.tfrecord', 'src.tfrecord']
+
+def test_encode_parse_round_trip():
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 256, (3, *IMAGE_SHAPE), dtype=np.uint8)
+    records = [encode_example(image, label) for image, label in zip(images, [0, 7, 70])]
+    parsed_images, labels = parse_batch(tf.constant(records))
+    np.testing.assert_array_equal(parsed_images.numpy(), images)
+    assert labels.numpy().tolist() == [0, 7, 70]
+
+def test_encode_rejects_wrong_images():
+    with pytest.raises(ValueError):
+        encode_example(np.zeros(IMAGE_SHAPE, dtype=np.float32), 0)
+    with pytest.raises(ValueError):
+        encode_example(np.zeros((32, 32, 1), dtype=np.uint8), 0)
+
+def test_parse_rejects_another_format_version():
+    feature = {
+        'format_version': tf.train.Feature(int64_list=tf.train.Int64List(value=[RECORD_FORMAT_VERSION + 1])),
+        'label': tf.train.Feature(int64_list=tf.train.Int64List(value=[0])),
+        'image_raw': tf.train.Feature(bytes_list=tf.train.BytesList(value=[bytes(int(np.prod(IMAGE_SHAPE)))])),
+    }
+    record = tf.train.Example(features=tf.train.Features(feature=feature)).SerializeToString()
+    with pytest.raises(tf.errors.InvalidArgumentError):
+        parse_batch(tf.constant([record]))
+
+def test_packed_sample_store_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    samples = rng.integers(0, 256, (5, 4, 6), dtype=np.uint8)
+    labels = [3, 0, 3, 12, 1]
+    with PackedSampleStore(tmp_path / 'store', (4, 6)) as store:
+        for sample, label in zip(samples, labels):
+            store.write(sample, label)
+        with pytest.raises(ValueError):
+            store.write(np.zeros((6, 4), dtype=np.uint8), 0)
+    images, stored_labels = open_sample_store(tmp_path / 'store')
+    assert isinstance(images, np.memmap)
+    np.testing.assert_array_equal(images, samples)
+    assert stored_labels.tolist() == labels
+
+def test_empty_packed_sample_store(tmp_path):
+    with PackedSampleStore(tmp_path / 'store', (4, 6)):
+        pass
+    images, labels = open_sample_store(tmp_path / 'store')
+    assert images.shape == (0, 4, 6)
+    assert len(labels) == 0
+
+@pytest.fixture
+def etl9g(tmp_path, monkeypatch):
+    """data/test.py loaded as a module; it creates its output folders in the working directory."""
+    pytest.importorskip('cv2')
+    monkeypatch.chdir(tmp_path)
+    spec = importlib.util.spec_from_file_location('etl9g_ingest', ETL9G_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def test_unpack_4bit_splits_each_byte_into_two_pixels(etl9g):
+    packed = (np.arange(2 * etl9g.ETL9G_IMAGE_WIDTH * etl9g.ETL9G_IMAGE_HEIGHT // 2) % 256).astype(np.uint8)
+    images = etl9g.unpack_4bit(packed.reshape(2, -1))
+    assert images.shape == (2, etl9g.ETL9G_IMAGE_HEIGHT, etl9g.ETL9G_IMAGE_WIDTH)
+    flat = images.reshape(2, -1)
+    np.testing.assert_array_equal(flat[:, 0::2], (packed.reshape(2, -1) >> 4) * 17)
+    np.testing.assert_array_equal(flat[:, 1::2], (packed.reshape(2, -1) & 0x0F) * 17)
+
+def test_read_etl9g_file_keeps_kana_records(etl9g, tmp_path):
+    records = np.zeros(3, dtype=etl9g.ETL9G_RECORD_DTYPE)
+    records['jis_code'] = [0x2422, 0x3021, 0x2522]  # あ, a kanji, ア
+    records['image'][0] = 0x33  # every pixel at gray level 3
+    records['image'][1] = 0xFF
+    records['image'][2] = 0xFF
+    path = tmp_path / 'ETL9G_01'
+    records.tofile(path)
+    assert path.stat().st_size == 3 * etl9g.ETL9G_RECORD_SIZE
+
+    jis_codes, images = etl9g.read_etl9g_file(str(path))
+    assert jis_codes.tolist() == [0x2422, 0x2522]
+    assert [etl9g.jis_to_unicode(int(code)) for code in jis_codes] == ['あ', 'ア']
+    assert images.shape == (2, *etl9g.IMAGE_SIZE) and images.dtype == np.uint8
+    # Gray levels are stretched to 0-255 and inverted
+    assert np.all(images[0] == 255 - 3 * 17)
+    assert np.all(images[1] == 0)
@@ -0,0 +1,57 @@
+import json
+import pytest
+
+np = pytest.importorskip('numpy')
+tf = pytest.importorskip('tensorflow')
+pytest.importorskip('tensorflowjs')
+
+from export_model import evaluate_accuracy, export_report, export_tfjs, load_tfjs_model
+
+def tiny_model():
+    tf.keras.utils.set_random_seed(0)
+    model = tf.keras.Sequential([
+        tf.keras.layers.Input((4,)),
+        tf.keras.layers.Dense(8, activation='relu'),
+        tf.keras.layers.Dense(3, activation='softmax'),
+    ])
+    # Exact zeros check that the uint8 range keeps zero representable
+    kernel, bias = model.layers[0].get_weights()
+    kernel[0, :] = 0
+    model.layers[0].set_weights([kernel, bias + np.linspace(-0.3, 0.7, 8, dtype=np.float32)])
+    return model
+
+def tiny_dataset():
+    rng = np.random.default_rng(0)
+    images = rng.normal(size=(64, 4)).astype(np.float32)
+    labels = rng.integers(0, 3, 64)
+    return tf.data.Dataset.from_tensor_slices((images, labels)).batch(16)
+
+@pytest.mark.parametrize('quantization', ['float32', 'float16', 'uint8'])
+def test_exported_weights_load_back_within_quantization_error(tmp_path, quantization):
+    model = tiny_model()
+    export_tfjs(model, tmp_path, quantization)
+    for original, loaded in zip(model.get_weights(), load_tfjs_model(tmp_path).get_weights()):
+        assert loaded.shape == original.shape
+        if quantization == 'float32':
+            np.testing.assert_array_equal(loaded, original)
+        elif quantization == 'float16':
+            np.testing.assert_array_equal(loaded, original.astype(np.float16).astype(np.float32))
+        else:
+            # The converter shifts the range by up to half a step so zero is exact, then clips
+            step = (max(original.max(), 0) - min(original.min(), 0)) / 255
+            assert np.abs(loaded - original).max() <= step + 1e-6
+            assert np.all(loaded[original == 0] == 0)
+
+def test_export_report_evaluates_the_exported_variants(tmp_path):
+    model = tiny_model()
+    dataset = tiny_dataset()
+    report = export_report(model, dataset, tmp_path)
+    assert [row['quantization'] for row in report] == ['float32', 'float16', 'uint8']
+    assert report[0]['val_accuracy'] == pytest.approx(evaluate_accuracy(model, dataset))
+    for row in report:
+        assert (tmp_path / row['quantization'] / 'model.json').exists()
+        assert row['val_accuracy'] == pytest.approx(
+            evaluate_accuracy(load_tfjs_model(tmp_path / row['quantization']), dataset))
+    assert report[2]['weights_bytes'] < report[1]['weights_bytes'] < report[0]['weights_bytes']
+    with open(tmp_path / 'export_report.json', 'r', encoding='utf-8') as f:
+        assert json.load(f) == report
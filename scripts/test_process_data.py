@@ -0,0 +1,100 @@
+import os
+import json
+import pytest
+
+pytest.importorskip('cv2')
+pytest.importorskip('tensorflow')
+
+import process_data
+from dataset_io import list_shards, read_labeled_records
+from process_data import assign_class_ids, create_synthetic_data
+
+CHARS = ['あ', 'い', 'う', 'え', 'お', 'か']
+
+def test_assign_class_ids_keeps_existing_ids_and_never_reuses_removed_ones():
+    first, next_id = assign_class_ids(CHARS, {})
+    assert first == {char: i for i, char in enumerate(CHARS)}
+    assert next_id == len(CHARS)
+
+    # い is removed and き added: き must not take the id of い
+    second, next_id = assign_class_ids(CHARS[:1] + CHARS[2:] + ['き'],
+                                       {str(idx): char for char, idx in first.items()}, next_id)
+    assert all(second[char] == first[char] for char in CHARS if char != 'い')
+    assert second['き'] == len(CHARS)
+
+    # Removing the newest class still retires its id, thanks to next_class_id
+    third, _ = assign_class_ids(CHARS[:1] + CHARS[2:] + ['く'],
+                                {str(idx): char for char, idx in second.items() if char != 'き'}, next_id)
+    assert third['く'] == len(CHARS) + 1
+
+@pytest.fixture
+def build_dir(tmp_path, monkeypatch):
+    """Point process_data at an empty directory, with a small character set and no fonts."""
+    use_build_dir(monkeypatch, tmp_path)
+    monkeypatch.setattr(process_data, 'IMAGES_DIR', tmp_path)
+    monkeypatch.setattr(process_data, 'load_characters', lambda: list(CHARS))
+    monkeypatch.setattr(process_data, 'find_fonts', lambda font_paths=None: [])
+    monkeypatch.setattr(process_data, 'build_glyph_atlas', lambda *args, **kwargs: None)
+    return tmp_path
+
+def use_build_dir(monkeypatch, directory):
+    monkeypatch.setattr(process_data, 'PROCESSED_DIR', directory)
+    monkeypatch.setattr(process_data, 'MANIFEST_PATH', directory / 'build_manifest.json')
+
+def build(seed=1, workers=1):
+    return create_synthetic_data(num_variations=10, seed=seed, workers=workers, num_shards=2)
+
+def shard_mtimes(directory):
+    return {path: os.stat(path).st_mtime_ns for split in ('train', 'val') for path in list_shards(directory, split)}
+
+def shard_records(directory):
+    """Records of every shard in file order, keyed by shard name."""
+    return {os.path.basename(path): [record for _, record in read_labeled_records(path)]
+            for split in ('train', 'val') for path in list_shards(directory, split)}
+
+def test_unchanged_build_rewrites_nothing(build_dir):
+    assert build()
+    before = shard_mtimes(build_dir)
+    assert build()
+    assert shard_mtimes(build_dir) == before
+
+def test_changed_inputs_rebuild_only_the_affected_shards(build_dir, monkeypatch):
+    build(seed=1)
+    first = shard_records(build_dir)
+
+    # A different seed changes every class
+    build(seed=2)
+    reseeded = shard_records(build_dir)
+    assert all(reseeded[name] != first[name] for name in first)
+
+    # Dropping か (class 5, in shard 1) leaves the shard 0 files untouched
+    mtimes = shard_mtimes(build_dir)
+    monkeypatch.setattr(process_data, 'load_characters', lambda: CHARS[:-1])
+    build(seed=2)
+    after = shard_mtimes(build_dir)
+    assert {path for path in after if after[path] != mtimes[path]} == \
+        {path for path in after if '-00001-of-' in path}
+
+    labels = {label for split in ('train', 'val') for path in list_shards(build_dir, split)
+              for label, _ in read_labeled_records(path)}
+    assert labels == set(range(len(CHARS) - 1))
+    with open(build_dir / 'build_manifest.json', 'r', encoding='utf-8') as f:
+        assert json.load(f)['next_class_id'] == len(CHARS)
+
+def test_manifest_counts_the_records_of_every_split(build_dir, monkeypatch):
+    build(seed=1)
+    monkeypatch.setattr(process_data, 'load_characters', lambda: CHARS[:-1])
+    build(seed=1)
+    with open(build_dir / 'build_manifest.json', 'r', encoding='utf-8') as f:
+        records = json.load(f)['records']
+    assert records == {split: sum(len(shard) for name, shard in shard_records(build_dir).items()
+                                  if name.startswith(split)) for split in ('train', 'val')}
+    assert sum(records.values()) == (len(CHARS) - 1) * 10
+
+def test_output_does_not_depend_on_the_worker_count(build_dir, tmp_path_factory, monkeypatch):
+    build(workers=1)
+    serial = shard_records(build_dir)
+
+    use_build_dir(monkeypatch, tmp_path_factory.mktemp('parallel'))
+    build(workers=3)
+    assert shard_records(process_data.PROCESSED_DIR) == serial
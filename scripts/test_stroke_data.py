@@ -0,0 +1,43 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+pytest.importorskip('tensorflow')
+
+from stroke_data import SEQUENCE_LENGTH, STROKE_FEATURES, resample_strokes
+
+def line(start, end, points=10):
+    return np.linspace(start, end, points).astype(np.float32)
+
+def stroke_lengths(sequence):
+    """Points per stroke, split at the pen_up markers."""
+    ends = np.flatnonzero(sequence[:, 2]) + 1
+    return np.diff(np.concatenate([[0], ends])).tolist()
+
+@pytest.mark.parametrize('count', [1, 2, 5, SEQUENCE_LENGTH // 2])
+def test_every_stroke_gets_at_least_two_points_and_the_budget_is_exact(count):
+    strokes = [line((i, 0), (i + 1 + 5 * (i % 3), 10)) for i in range(count)]
+    sequence = resample_strokes(strokes)
+    assert sequence.shape == (SEQUENCE_LENGTH, STROKE_FEATURES)
+    lengths = stroke_lengths(sequence)
+    assert len(lengths) == count
+    assert sum(lengths) == SEQUENCE_LENGTH
+    assert min(lengths) >= 2
+
+def test_too_many_strokes_keeps_the_longest_in_their_order():
+    strokes = [line((i, 0), (i, 1 + (i % 2) * 20), points=3 + (i % 2) * 20) for i in range(SEQUENCE_LENGTH)]
+    sequence = resample_strokes(strokes)
+    lengths = stroke_lengths(sequence)
+    assert len(lengths) == SEQUENCE_LENGTH // 2
+    assert sum(lengths) == SEQUENCE_LENGTH
+    # Only the long (odd) strokes survive, still left to right
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    np.testing.assert_array_equal(sequence[starts, 0], np.arange(1, SEQUENCE_LENGTH, 2))
+
+def test_points_follow_the_stroke_end_to_end():
+    sequence = resample_strokes([line((0, 0), (30, 0))])
+    np.testing.assert_allclose(sequence[[0, -1], :2], [[0, 0], [30, 0]], atol=1e-5)
+    assert np.all(np.diff(sequence[:, 0]) > 0)
+
+def test_no_strokes_gives_an_empty_sequence():
+    assert not resample_strokes([]).any()
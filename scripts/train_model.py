@@ -1,113 +1,422 @@
 import tensorflow as tf
 import numpy as np
-import os
+import time
 import json
+import shutil
+import argparse
 from tensorflow.keras import layers, models
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from pathlib import Path
+from dataset_io import class_count, files_fingerprint, list_shards, load_build_manifest, parse_batch
+from augmentation import augment_batch
+from instrumentation import StageTrace
+from stroke_data import STROKE_SHAPE, load_stroke_split
+from export_model import (QUANTIZATION_CHOICES, RUNS_DIR, WEIGHT_SHARD_SIZE, evaluate_accuracy, export_report,
+                          export_tfjs)
 
 # Configuration
 INPUT_SHAPE = (64, 64, 1)  # 64x64 grayscale images
 BATCH_SIZE = 32
 EPOCHS = 5
+SHUFFLE_BUFFER = 10000
+SEED = 42
+LEARNING_RATE = 1e-3  # Adam learning rate for a single replica; scaled linearly with replicas
+ARCHITECTURE = 'cnn'
+ARCHITECTURES = ('cnn', 'cnn_gap', 'mobilenet')
+STROKE_ARCHITECTURES = ('conv1d', 'gru')
 
 # Project paths
 PROJECT_ROOT = Path(__file__).parent.parent
 DATA_DIR = PROJECT_ROOT / 'data'
 PROCESSED_DIR = DATA_DIR / 'processed_data'
 MODEL_DIR = PROJECT_ROOT / 'public/models/japanese_character_model'
+STROKE_MODEL_DIR = PROJECT_ROOT / 'public/models/japanese_stroke_model'
+PROFILE_DIR = RUNS_DIR / 'logs'
+CHECKPOINT_DIR = RUNS_DIR / 'checkpoints'
 
-def create_model(num_classes):
-    """Create a CNN model for Japanese character recognition."""
+# Fine-tuning on newly collected samples
+FINETUNE_LEARNING_RATE = 1e-4
+REPLAY_RATIO = 0.5  # Share of each fine-tuning batch drawn from the original training data
+
+def _scaled(filters, width):
+    """Scale a filter count by the width multiplier, keeping it a multiple of 8."""
+    return max(8, int(filters * width + 4) // 8 * 8)
+
+def create_model(num_classes, architecture=ARCHITECTURE, width=1.0, depth=2):
+    """Create a CNN model for Japanese character recognition.
+    
+    architecture selects the family: 'cnn' (Conv2D blocks, Flatten/Dense(512)
+    head), 'cnn_gap' (the same blocks with a global-average-pooling head) or
+    'mobilenet' (depthwise-separable blocks with a global-average-pooling
+    head). width scales every filter count and depth is the number of
+    convolutions per block.
+    """
+    if architecture not in ARCHITECTURES:
+        raise ValueError(f"Unknown architecture {architecture!r}; expected one of {ARCHITECTURES}")
+    
     model = models.Sequential([
-        # Input layer
+        # Input layer takes raw [0, 255] pixels so the exported model needs no preprocessing
         layers.Input(shape=INPUT_SHAPE),
-        
-        # First convolutional block
-        layers.Conv2D(32, (3, 3), activation='relu', padding='same'),
-        layers.BatchNormalization(),
-        layers.Conv2D(32, (3, 3), activation='relu', padding='same'),
-        layers.BatchNormalization(),
-        layers.MaxPooling2D((2, 2)),
-        layers.Dropout(0.25),
-        
-        # Second convolutional block
-        layers.Conv2D(64, (3, 3), activation='relu', padding='same'),
-        layers.BatchNormalization(),
-        layers.Conv2D(64, (3, 3), activation='relu', padding='same'),
-        layers.BatchNormalization(),
-        layers.MaxPooling2D((2, 2)),
-        layers.Dropout(0.25),
-        
-        # Third convolutional block
-        layers.Conv2D(128, (3, 3), activation='relu', padding='same'),
-        layers.BatchNormalization(),
-        layers.Conv2D(128, (3, 3), activation='relu', padding='same'),
-        layers.BatchNormalization(),
-        layers.MaxPooling2D((2, 2)),
-        layers.Dropout(0.25),
-        
-        # Dense layers
-        layers.Flatten(),
-        layers.Dense(512, activation='relu'),
-        layers.BatchNormalization(),
-        layers.Dropout(0.5),
-        layers.Dense(num_classes, activation='softmax')
+        layers.Rescaling(1.0 / 255),
     ])
     
+    # Three convolutional blocks, halving resolution and doubling filters each time
+    for block, filters in enumerate((32, 64, 128)):
+        filters = _scaled(filters, width)
+        for i in range(depth):
+            if architecture == 'mobilenet' and not (block == 0 and i == 0):
+                # Depthwise 3x3 followed by a pointwise 1x1 projection
+                model.add(layers.DepthwiseConv2D((3, 3), padding='same', use_bias=False))
+                model.add(layers.BatchNormalization())
+                model.add(layers.ReLU())
+                model.add(layers.Conv2D(filters, (1, 1), use_bias=False))
+                model.add(layers.BatchNormalization())
+                model.add(layers.ReLU())
+            else:
+                model.add(layers.Conv2D(filters, (3, 3), activation='relu', padding='same'))
+                model.add(layers.BatchNormalization())
+        model.add(layers.MaxPooling2D((2, 2)))
+        model.add(layers.Dropout(0.25))
+    
+    # Classification head
+    if architecture == 'cnn':
+        model.add(layers.Flatten())
+        model.add(layers.Dense(_scaled(512, width), activation='relu'))
+        model.add(layers.BatchNormalization())
+        model.add(layers.Dropout(0.5))
+    else:
+        model.add(layers.GlobalAveragePooling2D())
+        model.add(layers.Dropout(0.2))
+    # Softmax stays float32 under mixed precision for numerically stable outputs
+    model.add(layers.Dense(num_classes, activation='softmax', dtype='float32'))
+    
     return model
 
-def load_data():
-    """Load and preprocess the dataset."""
-    # Load TFRecord files
-    train_dataset = tf.data.TFRecordDataset(str(PROCESSED_DIR / 'train.tfrecord'))
-    val_dataset = tf.data.TFRecordDataset(str(PROCESSED_DIR / 'val.tfrecord'))
-    
-    # Feature description for parsing
-    feature_description = {
-        'label': tf.io.FixedLenFeature([], tf.int64),
-        'image_raw': tf.io.FixedLenFeature([], tf.string)
-    }
-    
-    def _parse_function(example_proto):
-        parsed_features = tf.io.parse_single_example(example_proto, feature_description)
-        image = tf.io.parse_tensor(parsed_features['image_raw'], out_type=tf.float32)
-        image = tf.reshape(image, INPUT_SHAPE)
-        label = parsed_features['label']
-        return image, label
-    
-    # Parse and batch datasets
-    train_dataset = train_dataset.map(_parse_function).shuffle(1000).batch(BATCH_SIZE)
-    val_dataset = val_dataset.map(_parse_function).batch(BATCH_SIZE)
+def create_stroke_model(num_classes, architecture='conv1d', width=1.0):
+    """Create a small sequence model over resampled (dx, dy, pen_up) stroke points.
     
-    return train_dataset, val_dataset
+    'conv1d' stacks three 1D convolution blocks with a global-average-pooling
+    head; 'gru' runs a GRU over the features of one 1D convolution. width
+    scales every filter and unit count.
+    """
+    if architecture not in STROKE_ARCHITECTURES:
+        raise ValueError(f"Unknown stroke architecture {architecture!r}; expected one of {STROKE_ARCHITECTURES}")
+    
+    model = models.Sequential([layers.Input(shape=STROKE_SHAPE)])
+    if architecture == 'conv1d':
+        for filters in (32, 64, 128):
+            model.add(layers.Conv1D(_scaled(filters, width), 5, activation='relu', padding='same'))
+            model.add(layers.BatchNormalization())
+            model.add(layers.MaxPooling1D(2))
+        model.add(layers.GlobalAveragePooling1D())
+    else:
+        model.add(layers.Conv1D(_scaled(32, width), 3, activation='relu', padding='same'))
+        model.add(layers.GRU(_scaled(128, width)))
+    model.add(layers.Dropout(0.2))
+    model.add(layers.Dense(num_classes, activation='softmax', dtype='float32'))
+    return model
 
-def train_model():
-    """Train the Japanese character recognition model."""
-    # Load character mapping
-    with open(PROCESSED_DIR / 'character_map.json', 'r', encoding='utf-8') as f:
-        character_map = json.load(f)
+def make_dataset(files, batch_size=BATCH_SIZE, training=False, shuffle_buffer=SHUFFLE_BUFFER,
+                 cache=None, seed=SEED, augment=False, input_context=None, repeat=1, record_sharding=False):
+    """Build the input pipeline for one split.
     
-    num_classes = len(character_map)
-    print(f"Training model for {num_classes} character classes")
+    Shards are read with a parallel interleave, serialized records are
+    optionally cached (cache='memory' or a file path prefix; the file name
+    includes a fingerprint of the shards, so a rebuilt dataset never reads a
+    stale cache), shuffled with a seeded buffer, batched, parsed with a
+    parallel map and prefetched. With augment=True, training batches get
+    fresh random variations every epoch. Under a distribution strategy,
+    input_context selects this pipeline's share of the data: whole shard
+    files when there are enough of them, otherwise (or with
+    record_sharding=True, for builds that keep each class in one shard)
+    every n-th record. repeat makes one epoch that many passes over the
+    records (see train_repeat).
+    """
+    num_pipelines = input_context.num_input_pipelines if input_context else 1
+    pipeline_id = input_context.input_pipeline_id if input_context else 0
     
-    # Create and compile model
-    model = create_model(num_classes)
-    model.compile(
-        optimizer='adam',
-        loss='sparse_categorical_crossentropy',
-        metrics=['accuracy']
+    files_dataset = tf.data.Dataset.from_tensor_slices(files)
+    shard_files = num_pipelines > 1 and len(files) >= num_pipelines and not record_sharding
+    if shard_files:
+        files_dataset = files_dataset.shard(num_pipelines, pipeline_id)
+    if training:
+        files_dataset = files_dataset.shuffle(len(files), seed=seed)
+    
+    dataset = files_dataset.interleave(
+        tf.data.TFRecordDataset,
+        cycle_length=len(files),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=True
     )
+    if num_pipelines > 1 and not shard_files:
+        dataset = dataset.shard(num_pipelines, pipeline_id)
     
-    # Load datasets
-    train_dataset, val_dataset = load_data()
+    # Sharding is done above, so keep tf.data from auto-sharding again
+    options = tf.data.Options()
+    options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+    dataset = dataset.with_options(options)
     
-    # Create callbacks
+    # Cache serialized records so reshuffling still varies every epoch
+    if cache == 'memory':
+        dataset = dataset.cache()
+    elif cache:
+        fingerprint = files_fingerprint(files)
+        dataset = dataset.cache(f"{cache}_{'train' if training else 'val'}_{fingerprint}_{num_pipelines}_{pipeline_id}")
+    
+    if repeat > 1:
+        dataset = dataset.repeat(repeat)
+    if training:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    
+    return batch_and_parse(dataset, batch_size, training and augment)
+
+def batch_and_parse(dataset, batch_size, augment=False):
+    """Batch serialized records first, then parse, decode and optionally augment whole batches at once."""
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(parse_batch, num_parallel_calls=tf.data.AUTOTUNE)
+    if augment:
+        dataset = dataset.map(lambda images, labels: (augment_batch(images), labels),
+                              num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+def make_finetune_dataset(new_files, replay_files, replay_ratio=REPLAY_RATIO, batch_size=BATCH_SIZE,
+                          shuffle_buffer=SHUFFLE_BUFFER, seed=SEED, augment=False):
+    """Mix newly collected records with a replay stream of the original training data.
+    
+    Every record is drawn from the replay stream with probability
+    replay_ratio, so the model keeps seeing the classes it already knows. An
+    epoch ends when the new records run out.
+    """
+    new = tf.data.TFRecordDataset(new_files, num_parallel_reads=tf.data.AUTOTUNE).cache()
+    new = new.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    if not replay_files or replay_ratio <= 0:
+        return batch_and_parse(new, batch_size, augment)
+    
+    replay = tf.data.Dataset.from_tensor_slices(replay_files).shuffle(len(replay_files), seed=seed)
+    replay = replay.interleave(
+        tf.data.TFRecordDataset,
+        cycle_length=len(replay_files),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=True
+    )
+    replay = replay.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True).repeat()
+    mixed = tf.data.Dataset.sample_from_datasets(
+        [new, replay], weights=[1 - replay_ratio, replay_ratio], seed=seed, stop_on_empty_dataset=True
+    )
+    return batch_and_parse(mixed, batch_size, augment)
+
+def train_repeat(augment, data_dir=PROCESSED_DIR):
+    """Passes over the training records per epoch: the train variation count for an augmented --clean build, else 1.
+    
+    A clean build stores a single record per class, so without repeating
+    it an augmented epoch would show every class only once. Without
+    augmentation the repeats would be identical copies, so none are made.
+    """
+    params = load_build_manifest(data_dir).get('params', {})
+    if not augment or not params.get('clean'):
+        return 1
+    return max(1, round(params['variations'] * (1 - params['val_fraction'])))
+
+def train_examples(repeat=None, augment=False, data_dir=PROCESSED_DIR):
+    """Training examples seen in one epoch of load_data, from the build manifest; None when it has no count."""
+    records = load_build_manifest(data_dir).get('records', {}).get('train')
+    if records is None:
+        return None
+    return records * (train_repeat(augment, data_dir) if repeat is None else repeat)
+
+def load_data(batch_size=BATCH_SIZE, shuffle_buffer=SHUFFLE_BUFFER, cache=None, seed=SEED, augment=False,
+              strategy=None, repeat=None):
+    """Load and preprocess the dataset.
+    
+    With a distribution strategy, batch_size is the global batch size and
+    every input pipeline reads its own part of the shards, split by record
+    unless the build manifest says classes are spread over all shards.
+    repeat is the number of passes over the training records per epoch
+    (default: train_repeat(augment)).
+    """
+    repeat = train_repeat(augment) if repeat is None else repeat
+    train_files = list_shards(PROCESSED_DIR, 'train')
+    val_files = list_shards(PROCESSED_DIR, 'val')
+    if not train_files or not val_files:
+        raise FileNotFoundError(f"No TFRecord shards found in {PROCESSED_DIR}; run process_data.py first")
+    
+    if strategy is None:
+        train_dataset = make_dataset(train_files, batch_size, training=True, shuffle_buffer=shuffle_buffer,
+                                     cache=cache, seed=seed, augment=augment, repeat=repeat)
+        val_dataset = make_dataset(val_files, batch_size, cache=cache, seed=seed)
+        return train_dataset, val_dataset
+    
+    # Without a manifest saying otherwise, assume each class lives in one shard
+    record_sharding = load_build_manifest(PROCESSED_DIR).get('class_partitioned', True)
+    
+    def distributed(files, training):
+        def dataset_fn(input_context):
+            return make_dataset(files, input_context.get_per_replica_batch_size(batch_size), training,
+                                shuffle_buffer, cache, seed, augment and training, input_context,
+                                repeat if training else 1, record_sharding)
+        return strategy.distribute_datasets_from_function(dataset_fn)
+    
+    train_dataset = distributed(train_files, True)
+    val_dataset = distributed(val_files, False)
+    return train_dataset, val_dataset
+
+def make_stroke_dataset(sequences, labels, batch_size=BATCH_SIZE, training=False, seed=SEED):
+    """Batched dataset over in-memory stroke sequences; they are small enough to load whole."""
+    dataset = tf.data.Dataset.from_tensor_slices((np.asarray(sequences, dtype=np.float32),
+                                                  np.asarray(labels, dtype=np.int64)))
+    if training:
+        dataset = dataset.shuffle(len(labels), seed=seed, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+def benchmark_dataset(dataset, epochs=2):
+    """Iterate a dataset without training and report examples/sec per epoch."""
+    results = []
+    for epoch in range(epochs):
+        examples = 0
+        start = time.perf_counter()
+        for images, _ in dataset:
+            examples += int(images.shape[0])
+        elapsed = time.perf_counter() - start
+        rate = examples / max(elapsed, 1e-9)
+        print(f"Epoch {epoch + 1}: {examples} examples in {elapsed:.2f}s ({rate:.0f} examples/sec)")
+        results.append(rate)
+    return results
+
+def supports_bfloat16():
+    """Whether the CPU has native bfloat16 instructions (AVX512-BF16 or AMX)."""
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+def configure_precision(mixed_precision):
+    """Set the global Keras dtype policy; returns whether mixed bfloat16 is active."""
+    if mixed_precision and not supports_bfloat16():
+        print("WARNING: CPU lacks native bfloat16 support; training in float32")
+        mixed_precision = False
+    tf.keras.mixed_precision.set_global_policy('mixed_bfloat16' if mixed_precision else 'float32')
+    return mixed_precision
+
+class ThroughputCallback(tf.keras.callbacks.Callback):
+    """Record training wall time and examples/sec of every epoch, excluding validation.
+    
+    Keras validates before on_epoch_end, so the clock stops at on_test_begin.
+    Examples are steps * batch_size, capped at dataset_size (the examples in
+    one epoch, see train_examples) so the last, partial batch is not counted
+    in full.
+    """
+    
+    def __init__(self, batch_size, dataset_size=None):
+        super().__init__()
+        self.batch_size = batch_size
+        self.dataset_size = dataset_size
+        self.epoch_times = []
+        self.examples_per_sec = []
+    
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+        self._end = None
+        self._steps = 0
+    
+    def on_train_batch_end(self, batch, logs=None):
+        self._steps += 1
+    
+    def on_test_begin(self, logs=None):
+        # Only the first validation of an epoch ends its training time
+        if self._end is None:
+            self._end = time.perf_counter()
+    
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = (self._end or time.perf_counter()) - self._start
+        examples = self._steps * self.batch_size
+        if self.dataset_size is not None:
+            examples = min(examples, self.dataset_size)
+        self.epoch_times.append(elapsed)
+        self.examples_per_sec.append(examples / max(elapsed, 1e-9))
+
+class StageTraceCallback(tf.keras.callbacks.Callback):
+    """Charge training steps, validation passes and epochs to stages of a StageTrace.
+    
+    A step's time includes waiting for its input batch; use the TensorBoard
+    profiler to split input pipeline from compute.
+    """
+    
+    def __init__(self, trace):
+        super().__init__()
+        self.trace = trace
+    
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_start = time.perf_counter()
+    
+    def on_train_batch_begin(self, batch, logs=None):
+        self._step_start = time.perf_counter()
+    
+    def on_train_batch_end(self, batch, logs=None):
+        self.trace.add('train_step', time.perf_counter() - self._step_start, self._step_start)
+        self.trace.count('train_steps')
+    
+    def on_test_begin(self, logs=None):
+        self._test_start = time.perf_counter()
+    
+    def on_test_end(self, logs=None):
+        self.trace.add('validation', time.perf_counter() - self._test_start, self._test_start)
+    
+    def on_epoch_end(self, epoch, logs=None):
+        self.trace.add('epoch', time.perf_counter() - self._epoch_start, self._epoch_start)
+
+def extend_output_layer(model, num_classes):
+    """Widen the softmax layer to num_classes, keeping the trained weights of existing classes.
+    
+    Class ids are never reused, so new classes always come after the existing
+    ones; their weights start from the layer's initializer. All other layers
+    are shared with model.
+    """
+    head = model.layers[-1]
+    kernel, bias = head.get_weights()
+    known = kernel.shape[1]
+    if num_classes < known:
+        raise ValueError(f"Model predicts {known} classes but the character map only has {num_classes}")
+    if num_classes == known:
+        return model
+    
+    new_head = layers.Dense(num_classes, activation='softmax', dtype='float32', name=f"{head.name}_{num_classes}")
+    extended = models.Sequential([layers.Input(shape=INPUT_SHAPE), *model.layers[:-1], new_head])
+    new_kernel, new_bias = new_head.get_weights()
+    new_kernel[:, :known] = kernel
+    new_bias[:known] = bias
+    new_head.set_weights([new_kernel, new_bias])
+    print(f"Extended the output layer from {known} to {num_classes} classes")
+    return extended
+
+def check_class_ids(base_map, character_map):
+    """Make sure every class the base model knows keeps its id in the current character map."""
+    changed = [f"{idx}: {char} -> {character_map.get(idx)}" for idx, char in base_map.items()
+               if character_map.get(idx) != char]
+    if changed:
+        raise ValueError(f"Class ids changed since the base model was trained: {', '.join(changed)}")
+
+def training_callbacks(batch_size, trace, checkpoint_dir, profile_steps=None, profile_dir=PROFILE_DIR,
+                       model_dir=MODEL_DIR, dataset_size=None, best_path=None, initial_best=None):
+    """Callbacks shared by training and fine-tuning; returns (throughput callback, all callbacks).
+    
+    BackupAndRestore saves the weights, optimizer state and epoch to
+    checkpoint_dir after every epoch, so an interrupted run picks up where it
+    stopped when started again with the same arguments. The best epoch is
+    saved to best_path (default model_dir/best_model.h5), but only once its
+    val_accuracy beats initial_best.
+    """
+    throughput = ThroughputCallback(batch_size, dataset_size)
     callbacks = [
+        tf.keras.callbacks.BackupAndRestore(backup_dir=str(checkpoint_dir)),
+        throughput,
+        StageTraceCallback(trace),
         tf.keras.callbacks.ModelCheckpoint(
-            filepath=str(MODEL_DIR / 'best_model.h5'),
+            filepath=str(best_path or Path(model_dir) / 'best_model.h5'),
             save_best_only=True,
-            monitor='val_accuracy'
+            monitor='val_accuracy',
+            initial_value_threshold=initial_best
         ),
         tf.keras.callbacks.EarlyStopping(
             monitor='val_accuracy',
@@ -121,30 +430,382 @@ def train_model():
             min_lr=1e-6
         )
     ]
+    if profile_steps:
+        # Profile only the chosen steps; profiling the whole run is slow and produces huge traces
+        callbacks.append(tf.keras.callbacks.TensorBoard(log_dir=str(profile_dir), profile_batch=tuple(profile_steps)))
+        print(f"Profiling training steps {profile_steps[0]}-{profile_steps[1]} into {profile_dir}")
+    return throughput, callbacks
+
+def prepare_checkpoint_dir(checkpoint_dir, resume):
+    """Discard the backup of an interrupted run unless it should be resumed; returns True when resuming."""
+    checkpoint_dir = Path(checkpoint_dir)
+    if not resume and checkpoint_dir.exists():
+        shutil.rmtree(checkpoint_dir)
+    elif checkpoint_dir.exists():
+        print(f"Resuming from the backup in {checkpoint_dir}")
+        return True
+    return False
+
+def saved_accuracy(path, val_dataset):
+    """Validation accuracy of the model saved at path, or None when there is none."""
+    if not Path(path).exists():
+        return None
+    return evaluate_accuracy(tf.keras.models.load_model(path), val_dataset)
+
+def save_and_export(model, character_map, val_dataset, quantization='float32',
+                    weight_shard_size=WEIGHT_SHARD_SIZE, export_variants=False, model_dir=MODEL_DIR):
+    """Save the character mapping next to the model and export the model for TensorFlow.js."""
+    model_dir = Path(model_dir)
+    with open(model_dir / 'character_map.json', 'w', encoding='utf-8') as f:
+        json.dump(character_map, f, ensure_ascii=False, indent=2)
+    size = export_tfjs(model, model_dir, quantization, weight_shard_size)
+    print(f"Exported {quantization} TensorFlow.js model ({size / 1024:.0f} KB of weights)")
+    if export_variants:
+        export_report(model, val_dataset, RUNS_DIR / 'quantized' / model_dir.name, weight_shard_size)
+
+def get_strategy(distribute=None):
+    """Distribution strategy for 'mirrored' (local devices), 'multi_worker' (TF_CONFIG cluster) or none."""
+    if distribute == 'mirrored':
+        return tf.distribute.MirroredStrategy()
+    if distribute == 'multi_worker':
+        return tf.distribute.MultiWorkerMirroredStrategy()
+    return tf.distribute.get_strategy()
+
+def is_chief(strategy):
+    """Whether this process should write exports; always true outside multi-worker training."""
+    resolver = getattr(strategy, 'cluster_resolver', None)
+    if resolver is None or not resolver.task_type:
+        return True
+    if resolver.task_type == 'chief':
+        return True
+    has_chief = 'chief' in resolver.cluster_spec().as_dict()
+    return resolver.task_type == 'worker' and resolver.task_id == 0 and not has_chief
+
+def train_model(epochs=EPOCHS, batch_size=BATCH_SIZE, shuffle_buffer=SHUFFLE_BUFFER, cache=None, seed=SEED,
+                augment=False, quantization='float32', weight_shard_size=WEIGHT_SHARD_SIZE, export_variants=False,
+                architecture=ARCHITECTURE, width=1.0, depth=2, mixed_precision=False, jit_compile=False,
+                distribute=None, trace=None, profile_steps=None, profile_dir=PROFILE_DIR,
+                checkpoint_dir=CHECKPOINT_DIR / 'train', resume=True, repeat=None):
+    """Train the Japanese character recognition model.
     
-    # Train model
-    history = model.fit(
-        train_dataset,
-        validation_data=val_dataset,
-        epochs=EPOCHS,
-        callbacks=callbacks
-    )
+    batch_size is per replica; under a distribution strategy the global batch
+    size and the learning rate are both scaled by the number of replicas.
+    Stage timings go to trace (a StageTrace); profile_steps=(start, stop)
+    captures those training steps with the TensorBoard profiler into
+    profile_dir. An interrupted run resumes from checkpoint_dir unless
+    resume=False.
+    """
+    trace = trace or StageTrace('train_model')
+    # Multi-worker strategies must be created before any other TensorFlow op
+    strategy = get_strategy(distribute)
+    replicas = strategy.num_replicas_in_sync
+    global_batch_size = batch_size * replicas
     
-    # Save model for TensorFlow.js
+    # Load character mapping
+    with open(PROCESSED_DIR / 'character_map.json', 'r', encoding='utf-8') as f:
+        character_map = json.load(f)
+    
+    num_classes = class_count(character_map)
+    print(f"Training model for {num_classes} character classes")
+    if replicas > 1:
+        print(f"Training on {replicas} replicas: global batch size {global_batch_size}, "
+              f"learning rate {LEARNING_RATE * replicas:g}")
+    
+    # Create and compile model
+    mixed_precision = configure_precision(mixed_precision)
+    with trace.stage('build_model'), strategy.scope():
+        model = create_model(num_classes, architecture, width, depth)
+        model.compile(
+            optimizer=tf.keras.optimizers.Adam(LEARNING_RATE * replicas),
+            loss='sparse_categorical_crossentropy',
+            metrics=['accuracy'],
+            jit_compile=jit_compile
+        )
+    
+    # Load datasets
+    with trace.stage('load_data'):
+        train_dataset, val_dataset = load_data(global_batch_size, shuffle_buffer, cache, seed, augment,
+                                               strategy if distribute else None, repeat)
+    
+    # The distributed dataset needs every worker to iterate it, so evaluate outside fit on a plain one
+    eval_dataset = make_dataset(list_shards(PROCESSED_DIR, 'val'), batch_size, seed=seed) if distribute else val_dataset
+    
+    # Checkpoints are written into the model directory during training
     MODEL_DIR.mkdir(parents=True, exist_ok=True)
+    if is_chief(strategy):
+        prepare_checkpoint_dir(checkpoint_dir, resume)
+    # A resumed run only replaces the best model saved before the interruption when it beats it
+    initial_best = saved_accuracy(MODEL_DIR / 'best_model.h5', eval_dataset) if Path(checkpoint_dir).exists() else None
     
-    # Save character mapping
-    with open(MODEL_DIR / 'character_map.json', 'w', encoding='utf-8') as f:
-        json.dump(character_map, f, ensure_ascii=False, indent=2)
+    # Create callbacks
+    throughput, callbacks = training_callbacks(global_batch_size, trace, checkpoint_dir, profile_steps, profile_dir,
+                                               dataset_size=train_examples(repeat, augment),
+                                               initial_best=initial_best)
+    
+    # Train model
+    with trace.stage('fit'):
+        history = model.fit(
+            train_dataset,
+            validation_data=val_dataset,
+            epochs=epochs,
+            callbacks=callbacks
+        )
     
-    # Convert and save model for TensorFlow.js
-    tfjs_target = str(MODEL_DIR / 'model.json')
-    best_model_path = str(MODEL_DIR / 'best_model.h5')
-    tfjs_command = f"tensorflowjs_converter --input_format=keras {best_model_path} {tfjs_target}"
-    os.system(tfjs_command)
+    history.history['examples_per_sec'] = throughput.examples_per_sec
+    
+    # Only the chief exports; other workers' checkpoints go to temporary paths
+    if not is_chief(strategy):
+        return history
+    
+    # Convert and save the best model for TensorFlow.js
+    with trace.stage('export'):
+        best_model = tf.keras.models.load_model(MODEL_DIR / 'best_model.h5')
+        if mixed_precision:
+            # Export a plain float32 copy so TF.js never sees bfloat16 layer policies
+            configure_precision(False)
+            float_model = create_model(num_classes, architecture, width, depth)
+            float_model.set_weights(best_model.get_weights())
+            best_model = float_model
+        save_and_export(best_model, character_map, eval_dataset, quantization, weight_shard_size, export_variants)
     
     print("Model training completed and saved for TensorFlow.js")
     return history
 
+def finetune_model(new_files, base_model=MODEL_DIR / 'best_model.h5', replay_ratio=REPLAY_RATIO, epochs=EPOCHS,
+                   batch_size=BATCH_SIZE, shuffle_buffer=SHUFFLE_BUFFER, seed=SEED, augment=False,
+                   learning_rate=FINETUNE_LEARNING_RATE, quantization='float32',
+                   weight_shard_size=WEIGHT_SHARD_SIZE, export_variants=False, jit_compile=False, trace=None,
+                   profile_steps=None, profile_dir=PROFILE_DIR, checkpoint_dir=CHECKPOINT_DIR / 'finetune',
+                   resume=True):
+    """Continue training an existing model on newly collected samples.
+    
+    new_files are TFRecord files in the shared record schema. They are mixed
+    with a replay sample of the original training shards (see
+    make_finetune_dataset) and validated on the original validation split.
+    Classes added to the character map since the base model was trained get
+    new output units; the weights of the known classes are kept. The result
+    replaces MODEL_DIR/best_model.h5 only when it validates better than the
+    base model.
+    """
+    trace = trace or StageTrace('finetune_model')
+    base_model = Path(base_model)
+    with open(base_model.parent / 'character_map.json', 'r', encoding='utf-8') as f:
+        base_map = json.load(f)
+    with open(PROCESSED_DIR / 'character_map.json', 'r', encoding='utf-8') as f:
+        character_map = json.load(f)
+    check_class_ids(base_map, character_map)
+    num_classes = class_count(character_map)
+    
+    with trace.stage('build_model'):
+        configure_precision(False)
+        model = extend_output_layer(tf.keras.models.load_model(base_model), num_classes)
+        model.compile(
+            optimizer=tf.keras.optimizers.Adam(learning_rate),
+            loss='sparse_categorical_crossentropy',
+            metrics=['accuracy'],
+            jit_compile=jit_compile
+        )
+    
+    with trace.stage('load_data'):
+        val_files = list_shards(PROCESSED_DIR, 'val')
+        if not val_files:
+            raise FileNotFoundError(f"No validation shards found in {PROCESSED_DIR}; run process_data.py first")
+        train_dataset = make_finetune_dataset([str(f) for f in new_files], list_shards(PROCESSED_DIR, 'train'),
+                                              replay_ratio, batch_size, shuffle_buffer, seed, augment)
+        val_dataset = make_dataset(val_files, batch_size, seed=seed)
+    
+    # Fine-tuned epochs are saved apart from the base model and only promoted when they validate better
+    candidate = Path(checkpoint_dir).with_name(f"{Path(checkpoint_dir).name}_best_model.h5")
+    candidate.parent.mkdir(parents=True, exist_ok=True)
+    if not prepare_checkpoint_dir(checkpoint_dir, resume):
+        candidate.unlink(missing_ok=True)
+    with trace.stage('evaluate_base'):
+        initial_best = evaluate_accuracy(model, val_dataset)
+        initial_best = max(initial_best, saved_accuracy(candidate, val_dataset) or 0.0)
+    throughput, callbacks = training_callbacks(batch_size, trace, checkpoint_dir, profile_steps, profile_dir,
+                                               best_path=candidate, initial_best=initial_best)
+    
+    print(f"Fine-tuning {base_model.name} on {len(new_files)} new file(s) with {replay_ratio:.0%} replay "
+          f"(base val_accuracy {initial_best:.4f})")
+    with trace.stage('fit'):
+        history = model.fit(train_dataset, validation_data=val_dataset, epochs=epochs, callbacks=callbacks)
+    history.history['examples_per_sec'] = throughput.examples_per_sec
+    
+    if not candidate.exists():
+        print(f"No fine-tuned epoch beat the base model; {base_model} is kept")
+        return history
+    
+    with trace.stage('export'):
+        MODEL_DIR.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(candidate, MODEL_DIR / 'best_model.h5')
+        best_model = tf.keras.models.load_model(candidate)
+        save_and_export(best_model, character_map, val_dataset, quantization, weight_shard_size, export_variants)
+    
+    print("Fine-tuning completed and saved for TensorFlow.js")
+    return history
+
+def train_stroke_model(epochs=EPOCHS, batch_size=BATCH_SIZE, seed=SEED, architecture='conv1d', width=1.0,
+                       quantization='float32', weight_shard_size=WEIGHT_SHARD_SIZE, export_variants=False,
+                       trace=None, checkpoint_dir=CHECKPOINT_DIR / 'strokes', resume=True):
+    """Train the stroke-sequence model on the output of stroke_data.py and export it to STROKE_MODEL_DIR."""
+    trace = trace or StageTrace('train_stroke_model')
+    with open(PROCESSED_DIR / 'character_map.json', 'r', encoding='utf-8') as f:
+        character_map = json.load(f)
+    num_classes = class_count(character_map)
+    print(f"Training {architecture} stroke model for {num_classes} character classes")
+    
+    with trace.stage('load_data'):
+        train_sequences, train_labels = load_stroke_split('train')
+        train_dataset = make_stroke_dataset(train_sequences, train_labels, batch_size, training=True, seed=seed)
+        val_dataset = make_stroke_dataset(*load_stroke_split('val'), batch_size)
+    
+    with trace.stage('build_model'):
+        configure_precision(False)
+        model = create_stroke_model(num_classes, architecture, width)
+        model.compile(
+            optimizer=tf.keras.optimizers.Adam(LEARNING_RATE),
+            loss='sparse_categorical_crossentropy',
+            metrics=['accuracy']
+        )
+    
+    STROKE_MODEL_DIR.mkdir(parents=True, exist_ok=True)
+    initial_best = None
+    if prepare_checkpoint_dir(checkpoint_dir, resume):
+        initial_best = saved_accuracy(STROKE_MODEL_DIR / 'best_model.h5', val_dataset)
+    throughput, callbacks = training_callbacks(batch_size, trace, checkpoint_dir, model_dir=STROKE_MODEL_DIR,
+                                               dataset_size=len(train_labels), initial_best=initial_best)
+    with trace.stage('fit'):
+        history = model.fit(train_dataset, validation_data=val_dataset, epochs=epochs, callbacks=callbacks)
+    history.history['examples_per_sec'] = throughput.examples_per_sec
+    
+    with trace.stage('export'):
+        best_model = tf.keras.models.load_model(STROKE_MODEL_DIR / 'best_model.h5')
+        save_and_export(best_model, character_map, val_dataset, quantization, weight_shard_size,
+                        export_variants, STROKE_MODEL_DIR)
+    
+    print("Stroke model training completed and saved for TensorFlow.js")
+    return history
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the Japanese character recognition model.")
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help="Batch size per replica")
+    parser.add_argument('--shuffle-buffer', type=int, default=SHUFFLE_BUFFER,
+                        help="Records held in the training shuffle buffer")
+    parser.add_argument('--cache', default=None,
+                        help="Cache serialized records: 'memory' or a file path prefix for an on-disk cache")
+    parser.add_argument('--repeat', type=int, default=None,
+                        help="Passes over the training records per epoch (default: the variation count "
+                             "for a --clean build trained with --augment, otherwise 1)")
+    parser.add_argument('--seed', type=int, default=SEED,
+                        help="Seed for shard order and shuffling")
+    parser.add_argument('--augment', action='store_true',
+                        help="Apply random affine, stroke-width, elastic, noise and blur augmentation on the fly")
+    parser.add_argument('--input', choices=('raster', 'strokes'), default='raster',
+                        help="Train the CNN on 64x64 rasters or a sequence model on stroke_data.py output")
+    parser.add_argument('--architecture', choices=ARCHITECTURES, default=ARCHITECTURE,
+                        help="Model family (see create_model)")
+    parser.add_argument('--stroke-architecture', choices=STROKE_ARCHITECTURES, default='conv1d',
+                        help="Sequence model for --input strokes (see create_stroke_model)")
+    parser.add_argument('--width', type=float, default=1.0, help="Filter count multiplier")
+    parser.add_argument('--depth', type=int, default=2, help="Convolutions per block")
+    parser.add_argument('--mixed-precision', action='store_true',
+                        help="Train with mixed bfloat16 precision when the CPU supports it")
+    parser.add_argument('--jit-compile', action='store_true',
+                        help="Compile the training step with XLA")
+    parser.add_argument('--distribute', choices=('mirrored', 'multi_worker'), default=None,
+                        help="Train with MirroredStrategy or MultiWorkerMirroredStrategy (cluster from TF_CONFIG)")
+    parser.add_argument('--quantize', choices=QUANTIZATION_CHOICES, default='float32',
+                        help="Weight quantization of the exported TensorFlow.js model")
+    parser.add_argument('--shard-size', type=int, default=WEIGHT_SHARD_SIZE,
+                        help="Maximum bytes per TensorFlow.js weight shard file")
+    parser.add_argument('--export-report', action='store_true',
+                        help="Export every quantization variant and report accuracy vs size on the validation split")
+    parser.add_argument('--benchmark-input', action='store_true',
+                        help="Only iterate the training input pipeline and report examples/sec")
+    parser.add_argument('--trace', default=None,
+                        help="Write per-stage timings and counters to this .json or .csv file")
+    parser.add_argument('--profile-steps', type=int, nargs=2, metavar=('START', 'STOP'), default=None,
+                        help="Capture these training steps (1-based, inclusive) with the TensorBoard profiler")
+    parser.add_argument('--profile-dir', default=str(PROFILE_DIR),
+                        help="TensorBoard log directory for --profile-steps")
+    parser.add_argument('--fresh', dest='resume', action='store_false',
+                        help="Discard the backup of an interrupted run instead of resuming from it")
+    parser.add_argument('--finetune', nargs='+', default=None, metavar='TFRECORD',
+                        help="Fine-tune the existing model on these new TFRecord files instead of training from scratch")
+    parser.add_argument('--base-model', default=str(MODEL_DIR / 'best_model.h5'),
+                        help="Model to fine-tune; its character_map.json must sit next to it")
+    parser.add_argument('--replay-ratio', type=float, default=REPLAY_RATIO,
+                        help="Share of fine-tuning samples replayed from the original training data")
+    parser.add_argument('--learning-rate', type=float, default=FINETUNE_LEARNING_RATE,
+                        help="Adam learning rate for --finetune")
+    return parser.parse_args()
+
 if __name__ == '__main__':
-    train_model() 
\ No newline at end of file
+    args = parse_args()
+    trace = StageTrace('train_model')
+    if args.benchmark_input:
+        train_dataset, _ = load_data(args.batch_size, args.shuffle_buffer, args.cache, args.seed, args.augment,
+                                     repeat=args.repeat)
+        with trace.stage('benchmark_input'):
+            benchmark_dataset(train_dataset)
+    elif args.input == 'strokes':
+        train_stroke_model(
+            epochs=args.epochs,
+            batch_size=args.batch_size,
+            seed=args.seed,
+            architecture=args.stroke_architecture,
+            width=args.width,
+            quantization=args.quantize,
+            weight_shard_size=args.shard_size,
+            export_variants=args.export_report,
+            trace=trace,
+            resume=args.resume
+        )
+    elif args.finetune:
+        finetune_model(
+            new_files=args.finetune,
+            base_model=args.base_model,
+            replay_ratio=args.replay_ratio,
+            epochs=args.epochs,
+            batch_size=args.batch_size,
+            shuffle_buffer=args.shuffle_buffer,
+            seed=args.seed,
+            augment=args.augment,
+            learning_rate=args.learning_rate,
+            quantization=args.quantize,
+            weight_shard_size=args.shard_size,
+            export_variants=args.export_report,
+            jit_compile=args.jit_compile,
+            trace=trace,
+            profile_steps=args.profile_steps,
+            profile_dir=args.profile_dir,
+            resume=args.resume
+        )
+    else:
+        train_model(
+            epochs=args.epochs,
+            batch_size=args.batch_size,
+            shuffle_buffer=args.shuffle_buffer,
+            cache=args.cache,
+            seed=args.seed,
+            augment=args.augment,
+            quantization=args.quantize,
+            weight_shard_size=args.shard_size,
+            export_variants=args.export_report,
+            architecture=args.architecture,
+            width=args.width,
+            depth=args.depth,
+            mixed_precision=args.mixed_precision,
+            jit_compile=args.jit_compile,
+            distribute=args.distribute,
+            trace=trace,
+            profile_steps=args.profile_steps,
+            profile_dir=args.profile_dir,
+            resume=args.resume,
+            repeat=args.repeat
+        )
+    trace.report()
+    if args.trace:
+        trace.write(args.trace) 
\ No newline at end of file
@@ -61,8 +61,8 @@ class RecognitionService {
       // Resize to 64x64
       tensor = tf.image.resizeBilinear(tensor, [64, 64]);
       
-      // Normalize to [0,1]
-      tensor = tensor.toFloat().div(tf.scalar(255));
+      // Keep raw [0, 255] pixels; the model rescales them in its first layer
+      tensor = tensor.toFloat();
       
       // Add batch dimension
       return tensor.expandDims(0) as tf.Tensor4D;